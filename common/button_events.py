@@ -0,0 +1,57 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+Press, release and long press events of buttons, with keypad.Keys.
+- keypad scans and debounces the pins in the background, the loop only
+  reads the queue of events, it doesn't read the pins.
+- A long press is reported once while the button is still held, timed from
+  the frame that saw the press. Its release is reported as usual.
+"""
+import keypad
+
+PRESS = 0
+RELEASE = 1
+LONG_PRESS = 2
+
+
+class ButtonEvents:
+	"""The events of buttons, read once per frame"""
+
+	def __init__(self, pins, long_press=1.0, value_when_pressed=True, interval=0.02):
+		self.keys = keypad.Keys(
+			pins,
+			value_when_pressed=value_when_pressed,
+			pull=True,
+			interval=interval,
+		)
+		self.long_press = int(long_press * 1_000_000_000)
+		self._event = keypad.Event()
+		# time.monotonic_ns() of the press, None when released or long pressed
+		self._held_since = [None] * len(pins)
+		# reused by update()
+		self._events = []
+
+	def update(self, now_ns):
+		"""The list of (key_number, kind) since the last call"""
+		events = self._events
+		events.clear()
+		event = self._event
+		while self.keys.events.get_into(event):
+			key = event.key_number
+			if event.pressed:
+				self._held_since[key] = now_ns
+				events.append((key, PRESS))
+			else:
+				self._held_since[key] = None
+				events.append((key, RELEASE))
+		for key, since in enumerate(self._held_since):
+			if since is not None and now_ns - since >= self.long_press:
+				self._held_since[key] = None
+				events.append((key, LONG_PRESS))
+		return events
+
+	def clear(self):
+		"""Forget the events and the held buttons"""
+		self.keys.events.clear()
+		for key in range(len(self._held_since)):
+			self._held_since[key] = None
@@ -0,0 +1,145 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+Fixed rate frames against time.monotonic_ns() deadlines.
+- The time spent in the frame is not added to the frame delay.
+- Frames that are too late are skipped instead of accumulating lag.
+- Counts the missed frames and the jitter (how late the frames start).
+- tick() is the same as wait() for an asyncio task, the other tasks run
+  while it waits.
+- TicksFrameScheduler does the same with supervisor.ticks_ms(), for the
+  loops that must not allocate: the monotonic_ns() values are long ints,
+  the ticks are small ints, at the cost of a 1 ms resolution.
+"""
+import time
+
+try:
+	import asyncio
+except ImportError:
+	asyncio = None
+
+try:
+	import supervisor
+except ImportError:
+	supervisor = None
+
+# supervisor.ticks_ms() wraps around at 2**29
+TICKS_PERIOD = 1 << 29
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+
+def ticks_add(ticks, delta):
+	"""Add a delta to a supervisor.ticks_ms() value"""
+	return (ticks + delta) & TICKS_MAX
+
+
+def ticks_diff(ticks1, ticks2):
+	"""ticks1 - ticks2 in ms, for ticks less than 2**28 ms apart"""
+	return ((ticks1 - ticks2 + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
+
+
+class FrameScheduler:
+	"""Pace a loop at period seconds per frame"""
+
+	# time units per second of the clock
+	UNITS = 1_000_000_000
+
+	def __init__(self, period):
+		self.period = int(period * self.UNITS)
+		self.reset()
+
+	def now(self):
+		"""The clock of the deadlines, time.monotonic_ns()"""
+		return time.monotonic_ns()
+
+	def diff(self, time1, time2):
+		"""time1 - time2 in units of the clock"""
+		return time1 - time2
+
+	def add(self, time1, delta):
+		"""time1 + delta in units of the clock"""
+		return time1 + delta
+
+	def reset(self):
+		"""Restart the deadlines from now, after a deliberate pause"""
+		self.deadline = self.now()
+		self.frames = 0
+		self.missed = 0
+		self.jitter_max = 0
+		self.jitter_total = 0
+
+	def remaining(self):
+		"""Time left in units of the clock before the next frame is due"""
+		return self.diff(self.deadline, self.now())
+
+	def wait(self):
+		"""Sleep until the next frame is due, return its start time"""
+		now = self.now()
+		ahead = self.diff(self.deadline, now)
+		if ahead > 0:
+			time.sleep(ahead / self.UNITS)
+			now = self.now()
+		return self._start(now)
+
+	async def tick(self):
+		"""Let the other tasks run until the next frame, return its start time"""
+		now = self.now()
+		ahead = self.diff(self.deadline, now)
+		if ahead > 0:
+			await asyncio.sleep(ahead / self.UNITS)
+			now = self.now()
+		return self._start(now)
+
+	def _start(self, now):
+		"""Count the frame that starts now"""
+		late = self.diff(now, self.deadline)
+		if late >= self.period:
+			# skip the frames we are late for
+			missed = late // self.period
+			self.missed += missed
+			self.deadline = self.add(self.deadline, missed * self.period)
+			late -= missed * self.period
+		self.frames += 1
+		self.jitter_total += late
+		if late > self.jitter_max:
+			self.jitter_max = late
+		self.deadline = self.add(self.deadline, self.period)
+		return now
+
+	def stats(self):
+		"""Frames, missed frames and jitter in ms"""
+		units_per_ms = self.UNITS / 1000
+		if self.frames:
+			jitter_mean = self.jitter_total / self.frames / units_per_ms
+		else:
+			jitter_mean = 0
+		return {
+			"frames": self.frames,
+			"missed": self.missed,
+			"jitter_mean": jitter_mean,
+			"jitter_max": self.jitter_max / units_per_ms,
+		}
+
+	def report(self):
+		stats = self.stats()
+		return (
+			f"Frames: {stats['frames']} missed: {stats['missed']}"
+			f" jitter: {stats['jitter_mean']:.2f} ms (max {stats['jitter_max']:.2f} ms)"
+		)
+
+
+class TicksFrameScheduler(FrameScheduler):
+	"""FrameScheduler on supervisor.ticks_ms(), the times are in ms"""
+
+	UNITS = 1000
+
+	def now(self):
+		"""The clock of the deadlines, supervisor.ticks_ms()"""
+		return supervisor.ticks_ms()
+
+	def diff(self, time1, time2):
+		return ticks_diff(time1, time2)
+
+	def add(self, time1, delta):
+		return ticks_add(time1, delta)
@@ -0,0 +1,78 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+NeoPixels that only call show() when something changed.
+- Keeps the colors and brightness set, and the last ones pushed.
+- show() compares them and skips the push if they are the same,
+  the NeoPixel write is bit-banged with the interrupts disabled.
+- Counts the shows and the skipped shows.
+"""
+
+BLACK = (0, 0, 0)
+
+
+def to_rgb(color):
+	"""A color as a tuple, from a tuple or a 0xRRGGBB int"""
+	if isinstance(color, tuple):
+		return color
+	if isinstance(color, int):
+		if color == 0:
+			return BLACK
+		return ((color >> 16) & 0xFF, (color >> 8) & 0xFF, color & 0xFF)
+	return tuple(color)
+
+
+class PixelManager:
+	"""Wrap a NeoPixel object, colors and brightness are pushed on show()"""
+
+	def __init__(self, pixels):
+		pixels.auto_write = False
+		self.pixels = pixels
+		self._colors = [BLACK] * len(pixels)
+		self._brightness = pixels.brightness
+		# the state of the pixels, None if unknown
+		self._pushed = None
+		self._pushed_brightness = None
+		self.shows = 0
+		self.skipped = 0
+
+	def __len__(self):
+		return len(self._colors)
+
+	def __getitem__(self, index):
+		return self._colors[index]
+
+	def __setitem__(self, index, color):
+		self._colors[index] = to_rgb(color)
+
+	def fill(self, color):
+		color = to_rgb(color)
+		colors = self._colors
+		for index in range(len(colors)):
+			colors[index] = color
+
+	@property
+	def brightness(self):
+		return self._brightness
+
+	@brightness.setter
+	def brightness(self, value):
+		self._brightness = value
+
+	def show(self):
+		"""Push the colors and brightness if they changed, return if it did"""
+		if self._colors == self._pushed and self._brightness == self._pushed_brightness:
+			self.skipped += 1
+			return False
+		pixels = self.pixels
+		for index, color in enumerate(self._colors):
+			pixels[index] = color
+		pixels.brightness = self._brightness
+		pixels.show()
+		self._pushed = list(self._colors)
+		self._pushed_brightness = self._brightness
+		self.shows += 1
+		return True
+
+	def report(self):
+		return f"Pixels: {self.shows} shows, {self.skipped} skipped"
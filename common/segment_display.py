@@ -0,0 +1,136 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+Seg14x4 display that only sends what changed.
+- Keeps a shadow copy of the RAM of each HT16K33 backpack.
+- On show(), compares the buffer with the shadow and writes only the
+  range of RAM addresses that changed, and only to those backpacks.
+- render() writes a whole frame from a precomputed glyph table.
+- After a bus error the shadow is forgotten, the next show() writes all.
+"""
+import adafruit_ht16k33.segments
+
+# bytes of display RAM used by 4 characters of 14 segments
+RAM_SIZE = 8
+# the dot segment in the high byte of a character
+DOT = 0b01000000
+
+
+def make_glyphs():
+	"""
+	Segments of each character code, low byte then high byte,
+	from the CHARS table of the library.
+	"""
+	chars = adafruit_ht16k33.segments.CHARS
+	glyphs = bytearray(512)
+	for code in range(32, 128):
+		character = code * 2 - 64
+		glyphs[code * 2] = chars[character + 1]
+		glyphs[code * 2 + 1] = chars[character]
+	# display a cleaner 5
+	glyphs[ord("5") * 2] = glyphs[ord("S") * 2]
+	glyphs[ord("5") * 2 + 1] = glyphs[ord("S") * 2 + 1]
+	return glyphs
+
+GLYPHS = make_glyphs()
+
+
+class SegmentDisplay(adafruit_ht16k33.segments.Seg14x4):
+	"""Seg14x4 with a shadow framebuffer per backpack"""
+
+	def __init__(self, i2c, address=0x70, auto_write=True, chars_per_display=4):
+		if isinstance(address, (tuple, list)):
+			num_devices = len(address)
+		else:
+			num_devices = 1
+		# the parent class init shows the empty buffer
+		self._shadow = bytearray(RAM_SIZE * num_devices)
+		self._shadow_valid = False
+		# register address and data of a partial write
+		self._scratch = bytearray(RAM_SIZE + 1)
+		self.writes = 0
+		self.bytes_written = 0
+		self.skipped = 0
+		super().__init__(i2c, address, auto_write, chars_per_display)
+		# position of the low byte of each character in the buffer
+		self._positions = bytearray(
+			self._adjusted_index(index * 2) + 1 for index in range(self._chars)
+		)
+
+	def _put(self, char, index=0):
+		"""Put a character at the specified place, from the glyph table"""
+		if not 0 <= index < self._chars:
+			return
+		code = ord(char)
+		if not 32 <= code <= 127:
+			return
+		position = self._positions[index]
+		if char == ".":
+			self._buffer[position + 1] |= DOT
+			return
+		self._buffer[position] = GLYPHS[code * 2]
+		self._buffer[position + 1] = GLYPHS[code * 2 + 1]
+
+	def render(self, frame, dots=0):
+		"""
+		Write a full frame, one character per digit, no dot parsing.
+		The frame is a str, bytes or bytearray, dots is a bitmask of the
+		digits that show their dot.
+		"""
+		if isinstance(frame, str):
+			frame = frame.encode()
+		buffer = self._buffer
+		positions = self._positions
+		for index in range(self._chars):
+			code = frame[index] * 2
+			position = positions[index]
+			buffer[position] = GLYPHS[code]
+			if dots >> index & 1:
+				buffer[position + 1] = GLYPHS[code + 1] | DOT
+			else:
+				buffer[position + 1] = GLYPHS[code + 1]
+		if self._auto_write:
+			self.show()
+
+	def invalidate(self):
+		"""Forget the shadow, the next show() writes everything"""
+		self._shadow_valid = False
+
+	def show(self):
+		"""Write the RAM addresses that changed since the last show"""
+		buffer = self._buffer
+		shadow = self._shadow
+		scratch = self._scratch
+		valid = self._shadow_valid
+		# an index loop, enumerate() would allocate at every show
+		for index in range(len(self.i2c_device)):
+			i2c_dev = self.i2c_device[index]
+			offset = index * self._buffer_size + 1
+			shadow_offset = index * RAM_SIZE
+			# find the first and last RAM address that changed
+			first = -1
+			last = -1
+			for addr in range(RAM_SIZE):
+				value = buffer[offset + addr]
+				if not valid or value != shadow[shadow_offset + addr]:
+					if first < 0:
+						first = addr
+					last = addr
+					shadow[shadow_offset + addr] = value
+			if first < 0:
+				self.skipped += 1
+				continue
+			# register address followed by the data
+			scratch[0] = first
+			for addr in range(first, last + 1):
+				scratch[1 + addr - first] = buffer[offset + addr]
+			try:
+				with i2c_dev:
+					i2c_dev.write(scratch, end=last - first + 2)
+			except OSError:
+				# the shadow has data the backpack may not have received
+				self.invalidate()
+				raise
+			self.writes += 1
+			self.bytes_written += last - first + 2
+		self._shadow_valid = True
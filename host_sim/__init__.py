@@ -0,0 +1,8 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+Host-side simulator of the WOPR hardware, to run and measure the programs
+on a computer. See README.md.
+"""
+from .clock import SimulationEnd, VirtualClock
+from .simulation import Simulation
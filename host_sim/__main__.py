@@ -0,0 +1,59 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+Run a WOPR program on the host.
+
+	python -m host_sim simple_clock/code.py --seconds 60 --press IO38@10
+"""
+import argparse
+import json
+
+from .simulation import Simulation
+
+
+def parse_press(text):
+	"""PIN@TIME[:DURATION] like IO38@10 or IO38@10:2.5"""
+	pin, _, when = text.partition("@")
+	if not when:
+		raise argparse.ArgumentTypeError(f"expected PIN@TIME, got {text}")
+	at, _, duration = when.partition(":")
+	return pin, float(at), float(duration or 0.1)
+
+
+def main():
+	parser = argparse.ArgumentParser(prog="python -m host_sim", description=__doc__.strip().splitlines()[0])
+	parser.add_argument("program", help="the program to run, like simple_clock/code.py")
+	parser.add_argument("--seconds", type=float, default=30, help="simulated seconds to run")
+	parser.add_argument("--press", type=parse_press, action="append", default=[],
+		metavar="PIN@T[:DUR]", help="press a button (like IO38@10), can be repeated")
+	parser.add_argument("--cpu-scale", type=float, default=0.0,
+		help="count the host CPU time, multiplied by this, as board time")
+	parser.add_argument("--drift", type=float, default=0.0, metavar="PPM",
+		help="drift of the board's clock from the real time")
+	parser.add_argument("--no-rtc", action="store_true", help="start with the RTC not set")
+	parser.add_argument("--seed", type=int, default=None, help="seed of the random module")
+	parser.add_argument("--trace", action="store_true", help="print every change of the display")
+	parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+	args = parser.parse_args()
+
+	sim = Simulation(
+		rtc_set=not args.no_rtc,
+		cpu_scale=args.cpu_scale,
+		drift_ppm=args.drift,
+		seed=args.seed,
+	)
+	for pin, at, duration in args.press:
+		sim.press(pin, at, duration)
+	summary = sim.run(args.program, args.seconds)
+
+	if args.trace:
+		for when, text in sim.display.history:
+			print(f"{when / 1_000_000_000:10.3f} [{text}]")
+	if args.json:
+		print(json.dumps(summary, indent=2))
+	else:
+		for key, value in summary.items():
+			print(f"{key:>18}: {value}")
+
+
+main()
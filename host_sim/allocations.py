@@ -0,0 +1,208 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+Find what the frames of a program would allocate on CircuitPython.
+- CPython allocates nearly every int and float, tracemalloc can't tell the
+  allocations that CircuitPython would make. This traces the opcodes of the
+  program and of the common modules instead (not the libraries or the
+  stand-ins), and counts the ones that allocate on CircuitPython:
+  building lists, tuples, dicts, sets, strings and slices, making functions,
+  calling the builtins that make objects (enumerate, zip, list...).
+- Long ints allocate, small ints and floats don't: a long int returned to
+  the program or stored in a variable counts, like time.monotonic_ns().
+- The frames that print are not part of the steady state and are not
+  counted. They are the rare ones, like the end of a password. Neither are
+  the frames that call one of the background functions of the program,
+  like the generation of the next passwords.
+"""
+import dis
+import os
+import sys
+
+from .simulation import COMMON
+
+# opcodes that make a new object
+BUILD_OPCODES = {
+	"BUILD_LIST", "BUILD_TUPLE", "BUILD_MAP", "BUILD_CONST_KEY_MAP",
+	"BUILD_SET", "BUILD_STRING", "BUILD_SLICE", "FORMAT_VALUE",
+	"MAKE_FUNCTION", "LIST_TO_TUPLE",
+}
+# builtins whose call makes a new object
+ALLOCATING_CALLS = {
+	"bytearray", "bytes", "dict", "enumerate", "filter", "format", "iter",
+	"list", "map", "memoryview", "range", "repr", "reversed", "set",
+	"sorted", "str", "tuple", "zip",
+}
+LOAD_OPCODES = {"LOAD_GLOBAL", "LOAD_NAME"}
+STORE_OPCODES = {"STORE_NAME", "STORE_FAST", "STORE_GLOBAL", "STORE_DEREF"}
+# the range of the small ints of CircuitPython, bigger ones are long ints
+SMALL_INT_MAX = (1 << 30) - 1
+SMALL_INT_MIN = -(1 << 30)
+
+
+def is_long_int(value):
+	return (
+		isinstance(value, int) and not isinstance(value, bool)
+		and not SMALL_INT_MIN <= value <= SMALL_INT_MAX
+	)
+
+
+def is_called(instructions, index):
+	"""If the name loaded at index is the function of a call"""
+	instruction = instructions[index]
+	if instruction.opname == "LOAD_GLOBAL":
+		# the low bit pushes the NULL of a call
+		return bool(instruction.arg & 1)
+	return index > 0 and instructions[index - 1].opname == "PUSH_NULL"
+
+
+def range_in_for(instructions, index):
+	"""If the range() loaded at index is the iterable of a for loop"""
+	# follow the stack until the call leaves only its result,
+	# LOAD_GLOBAL pushes the NULL of the call, LOAD_NAME follows PUSH_NULL
+	depth = 0 if instructions[index].opname == "LOAD_GLOBAL" else 1
+	for position in range(index, len(instructions)):
+		instruction = instructions[position]
+		if instruction.opcode >= dis.HAVE_ARGUMENT:
+			depth += dis.stack_effect(instruction.opcode, instruction.arg, jump=False)
+		else:
+			depth += dis.stack_effect(instruction.opcode)
+		if instruction.opname == "CALL" and depth == 1:
+			return instructions[position + 1].opname == "GET_ITER"
+	return False
+
+
+def allocating_offsets(code):
+	"""The offsets of the instructions that allocate, and of those that print"""
+	instructions = list(dis.get_instructions(code))
+	allocating = {}
+	printing = set()
+	for index, instruction in enumerate(instructions):
+		if instruction.opname in BUILD_OPCODES:
+			allocating[instruction.offset] = instruction.opname
+		elif instruction.opname in LOAD_OPCODES and is_called(instructions, index):
+			if instruction.argval == "print":
+				printing.add(instruction.offset)
+			elif instruction.argval in ALLOCATING_CALLS:
+				if instruction.argval == "range" and range_in_for(instructions, index):
+					continue
+				allocating[instruction.offset] = f"{instruction.argval}()"
+	stores = {
+		instruction.offset: instruction.argval
+		for instruction in instructions
+		if instruction.opname in STORE_OPCODES
+	}
+	return allocating, printing, stores
+
+
+class AllocationTracer:
+	"""Trace the code of the program, frame by frame"""
+
+	def __init__(self, app_dir, background=()):
+		self.directories = (os.path.abspath(app_dir), COMMON)
+		# functions that are not part of the steady state
+		self.background = background
+		# per code object
+		self._offsets = {}
+		self._in_frame = False
+		# the frame printed or ran a background function
+		self._excluded = False
+		# the allocations of the frame, (file, line, what)
+		self._allocations = []
+		# the allocations of the steady state frames
+		self.frames = 0
+		self.allocating_frames = 0
+		self.allocations = {}
+		# variable and line of the store by the previous opcode of each traced frame
+		self._pending_store = {}
+
+	def is_traced(self, code):
+		return os.path.abspath(code.co_filename).startswith(self.directories)
+
+	def attach(self, scheduler_class):
+		"""Count the frames at FrameScheduler.wait()"""
+		tracer = self
+		wait = scheduler_class.wait
+
+		def traced_wait(scheduler):
+			tracer.end_frame()
+			now = wait(scheduler)
+			tracer.start_frame()
+			return now
+
+		scheduler_class.wait = traced_wait
+
+	def start_frame(self):
+		self._in_frame = True
+		self._excluded = False
+		self._allocations.clear()
+
+	def end_frame(self):
+		if not self._in_frame or self._excluded:
+			return
+		self.frames += 1
+		if self._allocations:
+			self.allocating_frames += 1
+		for allocation in self._allocations:
+			self.allocations[allocation] = self.allocations.get(allocation, 0) + 1
+
+	def _record(self, frame, what, line=None):
+		if self._in_frame:
+			if line is None:
+				line = frame.f_lineno
+			self._allocations.append((frame.f_code.co_filename, line, what))
+
+	def start(self):
+		sys.settrace(self._trace_call)
+
+	def stop(self):
+		sys.settrace(None)
+
+	def _trace_call(self, frame, event, arg):
+		if self.is_traced(frame.f_code):
+			if frame.f_code.co_name in self.background:
+				self._excluded = True
+			frame.f_trace_opcodes = True
+			return self._trace_program
+		if frame.f_back is not None and self.is_traced(frame.f_back.f_code):
+			# called by the program, look at what it returns
+			frame.f_trace_lines = False
+			return self._trace_callee
+		return None
+
+	def _trace_callee(self, frame, event, arg):
+		if event == "return" and is_long_int(arg):
+			self._record(frame.f_back, "long int")
+		return self._trace_callee
+
+	def _trace_program(self, frame, event, arg):
+		if event != "opcode":
+			return self._trace_program
+		code = frame.f_code
+		if code not in self._offsets:
+			self._offsets[code] = allocating_offsets(code)
+		allocating, printing, stores = self._offsets[code]
+		# the value stored by the previous opcode
+		store = self._pending_store.pop(frame, None)
+		if store is not None:
+			name, line = store
+			value = frame.f_locals.get(name, frame.f_globals.get(name))
+			if is_long_int(value):
+				self._record(frame, "long int", line)
+		offset = frame.f_lasti
+		if offset in allocating:
+			self._record(frame, allocating[offset])
+		elif offset in printing:
+			self._excluded = True
+		elif offset in stores:
+			self._pending_store[frame] = (stores[offset], frame.f_lineno)
+		return self._trace_program
+
+	def report(self):
+		"""Lines of the allocations by count"""
+		lines = []
+		ordered = sorted(self.allocations.items(), key=lambda item: -item[1])
+		for (filename, line, what), count in ordered:
+			path = os.path.relpath(filename, os.path.dirname(COMMON))
+			lines.append(f"{path}:{line} {what} in {count} frames")
+		return lines
@@ -0,0 +1,296 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+Benchmark the main loops of the programs in the simulator.
+
+	python -m host_sim.bench --seconds 60 --output bench.json
+	python -m host_sim.bench --baseline bench.json --threshold 0.1
+
+- The frames are measured around FrameScheduler.wait() or tick(), the busy
+  time of a frame does not count the sleeps (the blinks, the frame waits).
+  With tick(), the other tasks that ran while it waited count in the frame.
+- With --cpu-scale the host CPU time counts as board time, multiplied by
+  the scale. With 0 only the hardware (I2C, NeoPixels) takes time and the
+  results are reproducible.
+- The allocations are measured in a second run with tracemalloc, since it
+  slows down the code too much to time it. They are CPython allocations,
+  a proxy for the ones of CircuitPython.
+- The steady state frames of the allocation free programs are checked in a
+  third run, with the allocations that CircuitPython would make. The bench
+  fails if one of them allocates.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tracemalloc
+
+from .allocations import AllocationTracer
+from .simulation import REPO, Simulation
+
+"""The programs and how they are run"""
+APPS = {
+	"password_search": "password_cracking_animation/password_search.py",
+	"simple_clock": "simple_clock/code.py",
+}
+"""Simulated seconds of the allocations run"""
+ALLOCATION_SECONDS = 10
+"""
+The programs whose steady state frames must not allocate, and their
+background functions, that the frames call when there is time left.
+"""
+ALLOCATION_FREE = {
+	"password_search": ("get_password",),
+}
+"""Rough slowdown of CircuitPython on the ESP32-S2 compared to a desktop"""
+DEFAULT_CPU_SCALE = 100
+"""The metrics compared to the baseline, and if higher is better"""
+METRICS = {
+	"fps": True,
+	"frame_ms_p50": False,
+	"frame_ms_p99": False,
+	"first_frame_s": False,
+	"i2c_transactions_per_s": False,
+	"i2c_bytes_per_s": False,
+	"pixel_shows_per_s": False,
+	"alloc_bytes_per_frame": False,
+}
+
+
+class FrameProbe:
+	"""Wrap FrameScheduler.wait() and tick() to time the frames"""
+
+	def __init__(self, clock, allocations=False):
+		self.clock = clock
+		self.allocations = allocations
+		# busy time of each frame, in ns
+		self.busy = []
+		# transient allocation of each frame, in bytes
+		self.allocated = []
+		self.first_frame = None
+		self.last_frame = None
+		self._frame_start = None
+		self._frame_sleep = 0
+		self._frame_memory = 0
+
+	def attach(self, scheduler_class):
+		probe = self
+		wait = scheduler_class.wait
+
+		def probed_wait(scheduler):
+			probe.end_frame()
+			now = wait(scheduler)
+			probe.start_frame()
+			return now
+
+		tick = scheduler_class.tick
+
+		async def probed_tick(scheduler):
+			now = await tick(scheduler)
+			probe.end_frame()
+			probe.start_frame()
+			return now
+
+		scheduler_class.wait = probed_wait
+		scheduler_class.tick = probed_tick
+
+	def end_frame(self):
+		if self.allocations and self._frame_start is not None:
+			current, peak = tracemalloc.get_traced_memory()
+			self.allocated.append(max(peak - self._frame_memory, 0))
+		if self._frame_start is not None:
+			elapsed = self.clock.now_ns - self._frame_start
+			self.busy.append(elapsed - (self.clock.sleep_ns - self._frame_sleep))
+
+	def start_frame(self):
+		self.last_frame = self.clock.now_ns
+		if self.first_frame is None:
+			self.first_frame = self.last_frame
+		self._frame_start = self.clock.now_ns
+		self._frame_sleep = self.clock.sleep_ns
+		if self.allocations:
+			tracemalloc.reset_peak()
+			self._frame_memory = tracemalloc.get_traced_memory()[0]
+
+
+class BenchSimulation(Simulation):
+	"""A simulation with the probe in the frame scheduler"""
+
+	def __init__(self, allocations=False, **kwargs):
+		super().__init__(**kwargs)
+		self.probe = FrameProbe(self.clock, allocations)
+
+	def install(self):
+		super().install()
+		# imported in the simulation, the program will get the same module
+		from frame_scheduler import FrameScheduler
+		self.probe.attach(FrameScheduler)
+
+
+class TracedSimulation(Simulation):
+	"""A simulation that traces the allocations of the frames"""
+
+	def __init__(self, app_dir, background=(), **kwargs):
+		super().__init__(**kwargs)
+		self.tracer = AllocationTracer(app_dir, background)
+
+	def install(self):
+		super().install()
+		from frame_scheduler import FrameScheduler
+		self.tracer.attach(FrameScheduler)
+
+	def run(self, path, seconds):
+		self.tracer.start()
+		try:
+			return super().run(path, seconds)
+		finally:
+			self.tracer.stop()
+
+
+def percentile(values, fraction):
+	"""Nearest rank percentile of the values"""
+	if not values:
+		return 0
+	ordered = sorted(values)
+	rank = max(int(fraction * len(ordered) + 0.5) - 1, 0)
+	return ordered[min(rank, len(ordered) - 1)]
+
+
+def bench_app(path, seconds, cpu_scale, seed):
+	"""Run the program twice, for the timings and for the allocations"""
+	sim = BenchSimulation(cpu_scale=cpu_scale, seed=seed)
+	summary = sim.run(path, seconds)
+	probe = sim.probe
+	elapsed = summary["seconds"]
+	frames = len(probe.busy)
+	if frames and probe.last_frame > probe.first_frame:
+		fps = frames / ((probe.last_frame - probe.first_frame) / 1_000_000_000)
+	else:
+		fps = 0
+
+	alloc_sim = BenchSimulation(allocations=True, seed=seed)
+	tracemalloc.start()
+	try:
+		alloc_sim.run(path, min(seconds, ALLOCATION_SECONDS))
+	finally:
+		tracemalloc.stop()
+	allocated = alloc_sim.probe.allocated
+
+	return {
+		"seconds": elapsed,
+		"end": summary["end"],
+		"frames": frames,
+		"fps": fps,
+		"frame_ms_p50": percentile(probe.busy, 0.50) / 1_000_000,
+		"frame_ms_p99": percentile(probe.busy, 0.99) / 1_000_000,
+		"frame_ms_max": max(probe.busy, default=0) / 1_000_000,
+		"first_frame_s": (probe.first_frame or 0) / 1_000_000_000,
+		"i2c_transactions": summary["i2c_transactions"],
+		"i2c_bytes": summary["i2c_bytes"],
+		"i2c_transactions_per_s": summary["i2c_transactions"] / elapsed,
+		"i2c_bytes_per_s": summary["i2c_bytes"] / elapsed,
+		"i2c_bytes_per_frame": summary["i2c_bytes"] / frames if frames else 0,
+		"pixel_shows": summary["pixel_shows"],
+		"pixel_shows_per_s": summary["pixel_shows"] / elapsed,
+		"alloc_bytes_per_frame": sum(allocated) / len(allocated) if allocated else 0,
+		"allocating_frames": (
+			sum(1 for size in allocated if size) / len(allocated) if allocated else 0
+		),
+	}
+
+
+def check_allocations(path, background, seconds, seed):
+	"""The steady state frames and what they would allocate on the board"""
+	sim = TracedSimulation(os.path.dirname(path), background, seed=seed)
+	sim.run(path, min(seconds, ALLOCATION_SECONDS))
+	return sim.tracer
+
+
+def compare(results, baseline, threshold):
+	"""The metrics worse than the baseline by more than the threshold"""
+	regressions = []
+	for name, metrics in results["apps"].items():
+		reference = baseline.get("apps", {}).get(name)
+		if reference is None:
+			continue
+		for metric, higher_is_better in METRICS.items():
+			if metric not in reference:
+				continue
+			old = reference[metric]
+			new = metrics[metric]
+			if higher_is_better:
+				worse = new < old * (1 - threshold)
+			else:
+				worse = new > old * (1 + threshold)
+			if worse:
+				regressions.append((name, metric, old, new))
+	return regressions
+
+
+def main():
+	parser = argparse.ArgumentParser(prog="python -m host_sim.bench", description=__doc__.strip().splitlines()[0])
+	parser.add_argument("apps", nargs="*", metavar="APP",
+		help=f"the programs to run, among {', '.join(APPS)} (all by default)")
+	parser.add_argument("--seconds", type=float, default=60, help="simulated seconds per program")
+	parser.add_argument("--cpu-scale", type=float, default=DEFAULT_CPU_SCALE,
+		help="board time per host CPU time, 0 for reproducible results")
+	parser.add_argument("--seed", type=int, default=1, help="seed of the random module")
+	parser.add_argument("--output", help="write the results to this JSON file")
+	parser.add_argument("--baseline", help="compare with the results in this JSON file")
+	parser.add_argument("--threshold", type=float, default=0.1,
+		help="relative change that counts as a regression (default 0.1)")
+	parser.add_argument("--verbose", action="store_true", help="show the prints of the programs")
+	args = parser.parse_args()
+	for name in args.apps:
+		if name not in APPS:
+			parser.error(f"unknown program {name}")
+
+	results = {
+		"seconds": args.seconds,
+		"cpu_scale": args.cpu_scale,
+		"seed": args.seed,
+		"apps": {},
+	}
+	allocations = []
+	for name in args.apps or APPS:
+		path = os.path.join(REPO, APPS[name])
+		if args.verbose:
+			prints = contextlib.nullcontext()
+		else:
+			prints = contextlib.redirect_stdout(io.StringIO())
+		with prints:
+			results["apps"][name] = bench_app(path, args.seconds, args.cpu_scale, args.seed)
+			if name in ALLOCATION_FREE:
+				background = ALLOCATION_FREE[name]
+				tracer = check_allocations(path, background, args.seconds, args.seed)
+		if name in ALLOCATION_FREE:
+			results["apps"][name]["steady_frames"] = tracer.frames
+			results["apps"][name]["steady_allocating_frames"] = tracer.allocating_frames
+			allocations += [f"ALLOCATION {name} {line}" for line in tracer.report()]
+
+	output = json.dumps(results, indent=2)
+	if args.output:
+		with open(args.output, "w") as fp:
+			fp.write(output + "\n")
+	else:
+		print(output)
+
+	for line in allocations:
+		print(line, file=sys.stderr)
+	if allocations:
+		sys.exit(1)
+
+	if args.baseline:
+		with open(args.baseline) as fp:
+			baseline = json.load(fp)
+		regressions = compare(results, baseline, args.threshold)
+		for name, metric, old, new in regressions:
+			print(f"REGRESSION {name} {metric}: {old:.4g} -> {new:.4g}", file=sys.stderr)
+		if regressions:
+			sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
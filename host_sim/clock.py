@@ -0,0 +1,116 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+Virtual time for the simulation.
+- monotonic time only advances with sleep() and simulated hardware costs,
+  plus the host CPU time multiplied by cpu_scale if it is not 0.
+- the board's RTC keeps the time set by rtc.RTC().datetime.
+- the "true" UTC time, seen by the NTP servers, can drift from the board.
+"""
+import calendar
+import time as host_time
+import types
+
+# time for the board to read the clock, so that busy loops end when the
+# host CPU time is not counted
+READ_COST_NS = 10_000
+
+
+class SimulationEnd(BaseException):
+	"""Raised when the simulated time is up, not caught by except Exception"""
+
+
+class VirtualClock:
+	def __init__(self, start_time, cpu_scale=0.0, drift_ppm=0.0):
+		# the board starts with monotonic at 0
+		self.now_ns = 0
+		self.limit_ns = None
+		self.cpu_scale = cpu_scale
+		self.drift_ppm = drift_ppm
+		# UTC time in seconds when monotonic was 0
+		self.true_start = start_time
+		# RTC in seconds at monotonic rtc_set_ns
+		self.rtc_base = start_time
+		self.rtc_set_ns = 0
+		self.sleep_ns = 0
+		self.cpu_ns = 0
+		self._host_ns = host_time.perf_counter_ns()
+
+	def _charge_cpu(self):
+		"""Count the host time since the last call as board CPU time"""
+		host_now = host_time.perf_counter_ns()
+		if self.cpu_scale:
+			spent = int((host_now - self._host_ns) * self.cpu_scale)
+			self.now_ns += spent
+			self.cpu_ns += spent
+		self._host_ns = host_now
+
+	def monotonic_ns(self):
+		self._charge_cpu()
+		if not self.cpu_scale:
+			self.now_ns += READ_COST_NS
+		self.check_limit()
+		return self.now_ns
+
+	def check_limit(self):
+		if self.limit_ns is not None and self.now_ns >= self.limit_ns:
+			# only once, the program can clean up (asyncio.run cancels its tasks)
+			self.limit_ns = None
+			raise SimulationEnd("time is up")
+
+	def advance(self, nanoseconds):
+		"""Time spent by the board without using the CPU"""
+		self._charge_cpu()
+		self.now_ns += int(nanoseconds)
+		self.check_limit()
+
+	def sleep(self, seconds):
+		if seconds < 0:
+			raise ValueError("sleep length must be non-negative")
+		self.sleep_ns += int(seconds * 1_000_000_000)
+		self.advance(seconds * 1_000_000_000)
+
+	def wait_host(self, wait, timeout):
+		"""
+		Call wait(timeout) on the host, like a request waiting for its answer.
+		The time it takes counts as it is, as a sleep, not as CPU time.
+		"""
+		self._charge_cpu()
+		start = host_time.perf_counter_ns()
+		try:
+			return wait(timeout)
+		finally:
+			# also when it fails, like a request that times out
+			self._host_ns = host_time.perf_counter_ns()
+			waited = self._host_ns - start
+			self.sleep_ns += waited
+			self.advance(waited)
+
+	def rtc_time(self):
+		"""Seconds since the epoch according to the board's RTC"""
+		return self.rtc_base + (self.monotonic_ns() - self.rtc_set_ns) / 1_000_000_000
+
+	def set_rtc(self, struct_time):
+		self.rtc_base = calendar.timegm(tuple(struct_time)[:6] + (0, 0, 0))
+		self.rtc_set_ns = self.monotonic_ns()
+
+	def true_time(self):
+		"""The real UTC time, the board's crystal is off by drift_ppm"""
+		elapsed = self.now_ns / 1_000_000_000 * (1 + self.drift_ppm / 1_000_000)
+		return self.true_start + elapsed
+
+	def make_time_module(self):
+		"""A time module running on the virtual clock"""
+		module = types.ModuleType("time")
+		module.struct_time = host_time.struct_time
+		module.monotonic_ns = self.monotonic_ns
+		module.monotonic = lambda: self.monotonic_ns() / 1_000_000_000
+		module.sleep = self.sleep
+		module.time = lambda: int(self.rtc_time())
+		module.localtime = lambda secs=None: host_time.gmtime(
+			self.rtc_time() if secs is None else secs
+		)
+		module.mktime = lambda struct_time: calendar.timegm(tuple(struct_time))
+		# anything else (for the host libraries) is the real one
+		module.__getattr__ = lambda name: getattr(host_time, name)
+		return module
@@ -0,0 +1,70 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+An asyncio event loop on the virtual clock, for the programs using tasks.
+- loop.time() is the virtual time.monotonic(), and the loop waits for its
+  timers by moving the clock forward, like time.sleep().
+- The programs have no threads, like on the board, only the timers can
+  wake the loop.
+"""
+import asyncio
+import selectors
+
+
+class VirtualSelector(selectors.BaseSelector):
+	"""The selector of the host, waiting on the virtual clock"""
+
+	def __init__(self, clock):
+		self.clock = clock
+		self.selector = selectors.DefaultSelector()
+
+	def register(self, fileobj, events, data=None):
+		return self.selector.register(fileobj, events, data)
+
+	def unregister(self, fileobj):
+		return self.selector.unregister(fileobj)
+
+	def modify(self, fileobj, events, data=None):
+		return self.selector.modify(fileobj, events, data)
+
+	def get_map(self):
+		return self.selector.get_map()
+
+	def close(self):
+		self.selector.close()
+
+	def select(self, timeout=None):
+		# the loop's own wake up (call_soon_threadsafe, signals)
+		ready = self.selector.select(0)
+		if ready or timeout == 0:
+			return ready
+		if timeout is None:
+			raise RuntimeError("The event loop waits for nothing")
+		# nothing else can wake the loop but its timers
+		if timeout > 0:
+			# at least 1 ns, the timers are in float seconds, the clock counts ns
+			self.clock.sleep(max(timeout, 1e-9))
+		return []
+
+
+class VirtualEventLoop(asyncio.SelectorEventLoop):
+	"""An event loop that runs on the virtual clock"""
+
+	def __init__(self, clock):
+		self.clock = clock
+		super().__init__(VirtualSelector(clock))
+
+	def time(self):
+		self.clock.advance(0)
+		return self.clock.now_ns / 1_000_000_000
+
+
+class VirtualEventLoopPolicy(asyncio.DefaultEventLoopPolicy):
+	"""asyncio.run() and new_event_loop() make virtual loops"""
+
+	def __init__(self, clock):
+		super().__init__()
+		self.clock = clock
+
+	def new_event_loop(self):
+		return VirtualEventLoop(self.clock)
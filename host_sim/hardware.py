@@ -0,0 +1,424 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+Stand-ins for the hardware modules: board, busio, digitalio, keypad,
+neopixel, and the HT16K33 backpacks on the I2C bus.
+"""
+import types
+
+# I2C start, address byte and stop, in bit times
+I2C_OVERHEAD_BITS = 11
+# a NeoPixel is 24 bits at 800kHz, plus the reset latch
+NEOPIXEL_NS = 30_000
+NEOPIXEL_RESET_NS = 80_000
+
+
+class Pin:
+	def __init__(self, name):
+		self.name = name
+
+	def __repr__(self):
+		return f"board.{self.name}"
+
+	def __eq__(self, other):
+		return isinstance(other, Pin) and other.name == self.name
+
+	def __hash__(self):
+		return hash(self.name)
+
+
+def make_board_module():
+	module = types.ModuleType("board")
+	def get_pin(name):
+		if name.startswith("_"):
+			raise AttributeError(name)
+		pin = Pin(name)
+		setattr(module, name, pin)
+		return pin
+	module.__getattr__ = get_pin
+	return module
+
+
+####################################################################
+# I2C
+####################################################################
+
+class VirtualHT16K33:
+	"""The RAM and settings of one HT16K33 backpack"""
+
+	def __init__(self, address):
+		self.address = address
+		self.ram = bytearray(16)
+		self.oscillator = False
+		self.display_on = False
+		self.blink = 0
+		self.brightness = 15
+
+	def write(self, data):
+		if len(data) == 0:
+			return
+		command = data[0]
+		if command < 0x10:
+			# RAM address followed by data, with auto increment
+			for index, value in enumerate(data[1:]):
+				self.ram[(command + index) % 16] = value
+		elif command & 0xF0 == 0x20:
+			self.oscillator = bool(command & 1)
+		elif command & 0xF0 == 0x80:
+			self.display_on = bool(command & 1)
+			self.blink = (command >> 1) & 3
+		elif command & 0xF0 == 0xE0:
+			self.brightness = command & 0x0F
+
+	def read(self, buffer):
+		for index in range(len(buffer)):
+			buffer[index] = self.ram[index % 16]
+
+
+class I2CBus:
+	"""The devices on the bus and the traffic counters"""
+
+	def __init__(self, clock):
+		self.clock = clock
+		self.devices = {}
+		self.transactions = 0
+		self.bytes = 0
+		self.frequency = 100_000
+		# called after each write, to follow the displays
+		self.on_write = None
+
+	def add_device(self, device):
+		self.devices[device.address] = device
+
+	def transfer(self, address, num_bytes):
+		if address not in self.devices:
+			raise OSError(19, "No such device")
+		self.transactions += 1
+		self.bytes += num_bytes
+		bits = I2C_OVERHEAD_BITS + 9 * num_bytes
+		self.clock.advance(bits * 1_000_000_000 // self.frequency)
+		return self.devices[address]
+
+
+def make_busio_module(bus):
+	module = types.ModuleType("busio")
+
+	class I2C:
+		def __init__(self, scl=None, sda=None, *, frequency=100_000, timeout=255):
+			bus.frequency = frequency
+			self._locked = False
+
+		def try_lock(self):
+			if self._locked:
+				return False
+			self._locked = True
+			return True
+
+		def unlock(self):
+			self._locked = False
+
+		def scan(self):
+			return sorted(bus.devices)
+
+		def writeto(self, address, buffer, *, start=0, end=None):
+			data = bytes(buffer[start:end])
+			bus.transfer(address, len(data)).write(data)
+			if bus.on_write:
+				bus.on_write()
+
+		def readfrom_into(self, address, buffer, *, start=0, end=None):
+			view = memoryview(buffer)[start:end]
+			bus.transfer(address, len(view)).read(view)
+
+		def writeto_then_readfrom(self, address, out_buffer, in_buffer, *,
+				out_start=0, out_end=None, in_start=0, in_end=None):
+			self.writeto(address, out_buffer, start=out_start, end=out_end)
+			self.readfrom_into(address, in_buffer, start=in_start, end=in_end)
+
+		def deinit(self):
+			pass
+
+		def __enter__(self):
+			return self
+
+		def __exit__(self, *args):
+			self.deinit()
+
+	module.I2C = I2C
+	return module
+
+
+class VirtualDisplay:
+	"""The 12 characters of the backpacks, decoded from their RAM"""
+
+	def __init__(self, backpacks, clock, glyphs):
+		self.backpacks = backpacks
+		self.clock = clock
+		# segments to character, digits win over the letters they look like
+		self.characters = {}
+		for code in range(127, 31, -1):
+			word = glyphs[code * 2 + 1] << 8 | glyphs[code * 2]
+			self.characters.setdefault(word, chr(code))
+		for char in "0123456789 ":
+			code = ord(char)
+			self.characters[glyphs[code * 2 + 1] << 8 | glyphs[code * 2]] = char
+		self.history = []
+
+	def text(self):
+		"""The text shown, with the dots"""
+		out = []
+		for backpack in self.backpacks:
+			for digit in range(4):
+				word = backpack.ram[digit * 2 + 1] << 8 | backpack.ram[digit * 2]
+				out.append(self.characters.get(word & ~0x4000, "?"))
+				if word & 0x4000:
+					out.append(".")
+		return "".join(out)
+
+	def record(self):
+		"""Add the text to the history if it changed"""
+		text = self.text()
+		if not self.history or self.history[-1][1] != text:
+			self.history.append((self.clock.now_ns, text))
+
+
+####################################################################
+# buttons
+####################################################################
+
+class ButtonScript:
+	"""Scripted button presses, by pin name"""
+
+	def __init__(self, clock):
+		self.clock = clock
+		self.changes = []
+
+	def press(self, pin, at, duration=0.1):
+		"""Press the button of that pin at a time in seconds"""
+		self.changes.append((int(at * 1_000_000_000), pin, True))
+		self.changes.append((int((at + duration) * 1_000_000_000), pin, False))
+		self.changes.sort(key=lambda change: change[0])
+
+	def level(self, pin):
+		"""Whether the button is pressed now"""
+		pressed = False
+		for when, name, state in self.changes:
+			if when > self.clock.now_ns:
+				break
+			if name == pin:
+				pressed = state
+		return pressed
+
+
+def make_digitalio_module(buttons):
+	module = types.ModuleType("digitalio")
+
+	class Pull:
+		UP = "UP"
+		DOWN = "DOWN"
+
+	class Direction:
+		INPUT = "INPUT"
+		OUTPUT = "OUTPUT"
+
+	class DigitalInOut:
+		def __init__(self, pin):
+			self.pin = pin
+			self.direction = Direction.INPUT
+			self.pull = None
+			self._value = False
+
+		def switch_to_input(self, pull=None):
+			self.direction = Direction.INPUT
+			self.pull = pull
+
+		def switch_to_output(self, value=False, drive_mode=None):
+			self.direction = Direction.OUTPUT
+			self._value = value
+
+		@property
+		def value(self):
+			if self.direction == Direction.OUTPUT:
+				return self._value
+			pressed = buttons.level(self.pin.name)
+			# the buttons connect to 3.3V with a pull down
+			return pressed if self.pull != Pull.UP else not pressed
+
+		@value.setter
+		def value(self, value):
+			self._value = value
+
+		def deinit(self):
+			pass
+
+	module.Pull = Pull
+	module.Direction = Direction
+	module.DigitalInOut = DigitalInOut
+	return module
+
+
+def make_keypad_module(buttons, clock):
+	module = types.ModuleType("keypad")
+
+	class Event:
+		def __init__(self, key_number=0, pressed=True, timestamp=0):
+			self.key_number = key_number
+			self.pressed = pressed
+			self.timestamp = timestamp
+
+		@property
+		def released(self):
+			return not self.pressed
+
+		def __eq__(self, other):
+			return (
+				self.key_number == other.key_number
+				and self.pressed == other.pressed
+			)
+
+		def __repr__(self):
+			state = "pressed" if self.pressed else "released"
+			return f"<Event: key_number {self.key_number} {state}>"
+
+	class EventQueue:
+		def __init__(self, keys):
+			self.keys = keys
+			self.queue = []
+			self.overflowed = False
+
+		def _poll(self):
+			changes = buttons.changes
+			while self.keys.cursor < len(changes):
+				when, name, pressed = changes[self.keys.cursor]
+				if when > clock.now_ns:
+					break
+				self.keys.cursor += 1
+				if name in self.keys.names:
+					key_number = self.keys.names.index(name)
+					self.queue.append(Event(key_number, pressed, when // 1_000_000))
+
+		def get(self):
+			self._poll()
+			if self.queue:
+				return self.queue.pop(0)
+			return None
+
+		def get_into(self, event):
+			next_event = self.get()
+			if next_event is None:
+				return False
+			event.key_number = next_event.key_number
+			event.pressed = next_event.pressed
+			event.timestamp = next_event.timestamp
+			return True
+
+		def clear(self):
+			self._poll()
+			self.queue.clear()
+
+		def __len__(self):
+			self._poll()
+			return len(self.queue)
+
+		def __bool__(self):
+			return len(self) > 0
+
+	class Keys:
+		def __init__(self, pins, *, value_when_pressed, pull=True, interval=0.02, max_events=64):
+			self.names = [pin.name for pin in pins]
+			self.key_count = len(pins)
+			self.cursor = 0
+			self.events = EventQueue(self)
+
+		def reset(self):
+			self.events.clear()
+
+		def deinit(self):
+			pass
+
+	module.Event = Event
+	module.EventQueue = EventQueue
+	module.Keys = Keys
+	return module
+
+
+####################################################################
+# NeoPixels
+####################################################################
+
+class PixelRecorder:
+	"""What was pushed to a strip of NeoPixels"""
+
+	def __init__(self, pin, count):
+		self.pin = pin
+		self.count = count
+		self.shows = 0
+		self.history = []
+
+	def push(self, clock, colors, brightness):
+		self.shows += 1
+		clock.advance(NEOPIXEL_NS * self.count + NEOPIXEL_RESET_NS)
+		self.last = (tuple(colors), brightness)
+		if not self.history or self.history[-1][1:] != self.last:
+			self.history.append((clock.now_ns,) + self.last)
+
+
+def make_neopixel_module(recorders, clock):
+	module = types.ModuleType("neopixel")
+
+	def to_color(value):
+		if isinstance(value, int):
+			return ((value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF)
+		return tuple(value[:3])
+
+	class NeoPixel:
+		def __init__(self, pin, n, *, bpp=3, brightness=1.0, auto_write=True, pixel_order=None):
+			self.n = n
+			self.auto_write = auto_write
+			self._brightness = brightness
+			self._colors = [(0, 0, 0)] * n
+			self.recorder = PixelRecorder(pin.name, n)
+			recorders.setdefault(pin.name, []).append(self.recorder)
+
+		def __len__(self):
+			return self.n
+
+		def __getitem__(self, index):
+			return self._colors[index]
+
+		def __setitem__(self, index, value):
+			self._colors[index] = to_color(value)
+			if self.auto_write:
+				self.show()
+
+		def fill(self, color):
+			self._colors = [to_color(color)] * self.n
+			if self.auto_write:
+				self.show()
+
+		@property
+		def brightness(self):
+			return self._brightness
+
+		@brightness.setter
+		def brightness(self, value):
+			self._brightness = min(max(value, 0.0), 1.0)
+			if self.auto_write:
+				self.show()
+
+		def show(self):
+			self.recorder.push(clock, self._colors, self._brightness)
+
+		def deinit(self):
+			pass
+
+		def __enter__(self):
+			return self
+
+		def __exit__(self, *args):
+			self.deinit()
+
+	module.NeoPixel = NeoPixel
+	module.RGB = "RGB"
+	module.GRB = "GRB"
+	return module
@@ -0,0 +1,90 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+A local HTTP server standing in for the endpoints of the home checks.
+Each route has a body, an optional delay before answering, an ETag and a
+Last-Modified date for the conditional requests.
+"""
+import email.utils
+import hashlib
+import http.server
+import threading
+import time
+
+
+class Route:
+	def __init__(self, body, delay=0.0, content_type="application/json"):
+		if isinstance(body, str):
+			body = body.encode("utf8")
+		self.body = body
+		self.delay = delay
+		self.content_type = content_type
+		self.etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+		self.last_modified = email.utils.formatdate(time.time(), usegmt=True)
+		self.requests = 0
+		self.not_modified = 0
+
+
+class StandInServer:
+	"""Serve the routes on 127.0.0.1 in a thread"""
+
+	def __init__(self, port=0):
+		self.routes = {}
+		server = self
+
+		class Handler(http.server.BaseHTTPRequestHandler):
+			def do_GET(self):
+				route = server.routes.get(self.path)
+				if route is None:
+					self.send_error(404)
+					return
+				route.requests += 1
+				if route.delay:
+					time.sleep(route.delay)
+				etag = self.headers.get("If-None-Match")
+				modified = self.headers.get("If-Modified-Since")
+				if etag == route.etag or (etag is None and modified == route.last_modified):
+					route.not_modified += 1
+					self.send_response(304)
+					self.send_header("ETag", route.etag)
+					self.send_header("Last-Modified", route.last_modified)
+					self.end_headers()
+					return
+				self.send_response(200)
+				self.send_header("Content-Type", route.content_type)
+				self.send_header("Content-Length", str(len(route.body)))
+				self.send_header("ETag", route.etag)
+				self.send_header("Last-Modified", route.last_modified)
+				self.end_headers()
+				try:
+					self.wfile.write(route.body)
+				except (BrokenPipeError, ConnectionResetError):
+					# the client stopped reading, like a streaming parser does
+					pass
+
+			def log_message(self, *args):
+				pass
+
+		self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+		self.httpd.daemon_threads = True
+		self.thread = None
+
+	@property
+	def port(self):
+		return self.httpd.server_address[1]
+
+	def url(self, path):
+		return f"http://127.0.0.1:{self.port}{path}"
+
+	def set_route(self, path, body, delay=0.0, content_type="application/json"):
+		self.routes[path] = Route(body, delay, content_type)
+		return self.routes[path]
+
+	def start(self):
+		self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.httpd.shutdown()
+		self.httpd.server_close()
@@ -0,0 +1,297 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+Stand-ins for the network: wifi, socketpool with NTP servers answering
+from the virtual clock, and adafruit_requests over real HTTP (to a local
+stand-in server) with http.client.
+"""
+import http.client
+import ipaddress
+import json as json_module
+import struct
+import types
+import urllib.parse
+
+NTP_EPOCH_OFFSET = 2_208_988_800
+
+
+def make_ntp_reply(request, receive_time, transmit_time, stratum=2):
+	"""The reply of a server to a request, times in unix seconds"""
+	reply = bytearray(48)
+	# no leap second, version 4, server mode
+	reply[0] = 0b00100100
+	reply[1] = stratum
+	# reference, originate (the transmit of the request), receive, transmit
+	receive = receive_time + NTP_EPOCH_OFFSET
+	transmit = transmit_time + NTP_EPOCH_OFFSET
+	struct.pack_into("!II", reply, 16, int(receive), int(receive % 1 * 2**32))
+	reply[24:32] = request[40:48]
+	struct.pack_into("!II", reply, 32, int(receive), int(receive % 1 * 2**32))
+	struct.pack_into("!II", reply, 40, int(transmit), int(transmit % 1 * 2**32))
+	return bytes(reply)
+
+
+class FakeNetwork:
+	"""The access point and the servers seen by the board"""
+
+	def __init__(self, clock):
+		self.clock = clock
+		self.ssid = "WOPR"
+		self.bssid = bytes.fromhex("02deadbeef01")
+		self.channel = 6
+		self.rssi = -60
+		# full connection with a scan of all channels, or with a known AP
+		self.scan_time = 2.5
+		self.directed_time = 0.4
+		self.connect_fails = False
+		self.connections = 0
+		self.connect_time = 0
+		# time of a DNS lookup, and the addresses given to the host names
+		self.dns_time = 0.1
+		self.addresses = {}
+		# host: (time error of the server in s, round trip in s)
+		self.ntp_servers = {
+			"pool.ntp.org": (0.0, 0.05),
+			"0.pool.ntp.org": (0.002, 0.08),
+			"1.pool.ntp.org": (-0.001, 0.03),
+			"2.pool.ntp.org": (0.004, 0.12),
+		}
+		self.ntp_requests = 0
+
+	def resolve(self, host):
+		"""The address of a host name, after the time of the lookup"""
+		if host in self.addresses.values():
+			return host
+		self.clock.advance(self.dns_time * 1_000_000_000)
+		if host not in self.addresses:
+			self.addresses[host] = f"10.0.0.{len(self.addresses) + 1}"
+		return self.addresses[host]
+
+	def host_name(self, address):
+		for host, host_address in self.addresses.items():
+			if host_address == address:
+				return host
+		return address
+
+	def ntp_reply(self, host, request):
+		"""The answer of an NTP server, None if it doesn't answer"""
+		if host not in self.ntp_servers:
+			return None
+		error, round_trip = self.ntp_servers[host]
+		self.ntp_requests += 1
+		self.clock.advance(round_trip / 2 * 1_000_000_000)
+		server_time = self.clock.true_time() + error
+		reply = make_ntp_reply(request, server_time, server_time)
+		self.clock.advance(round_trip / 2 * 1_000_000_000)
+		return reply
+
+
+def make_wifi_module(network):
+	module = types.ModuleType("wifi")
+
+	class Network:
+		def __init__(self):
+			self.ssid = network.ssid
+			self.bssid = network.bssid
+			self.channel = network.channel
+			self.rssi = network.rssi
+
+	class Radio:
+		def __init__(self):
+			self._enabled = True
+			self.ipv4_address = None
+			self.ap_info = None
+
+		@property
+		def enabled(self):
+			return self._enabled
+
+		@enabled.setter
+		def enabled(self, value):
+			self._enabled = bool(value)
+			if not value:
+				self.ipv4_address = None
+				self.ap_info = None
+
+		@property
+		def connected(self):
+			return self.ipv4_address is not None
+
+		def connect(self, ssid, password="", *, channel=0, bssid=None, timeout=None):
+			if not self._enabled:
+				raise ConnectionError("WiFi is disabled")
+			directed = channel == network.channel and bytes(bssid or b"") == network.bssid
+			duration = network.directed_time if directed else network.scan_time
+			network.clock.advance(duration * 1_000_000_000)
+			network.connect_time += duration
+			if network.connect_fails or ssid != network.ssid:
+				raise ConnectionError("No network with that ssid")
+			if (channel and channel != network.channel) or (bssid and bytes(bssid) != network.bssid):
+				raise ConnectionError("No network with that ssid")
+			network.connections += 1
+			self.ipv4_address = ipaddress.ip_address("192.168.1.42")
+			self.ap_info = Network()
+
+		def stop_station(self):
+			self.ipv4_address = None
+			self.ap_info = None
+
+	module.radio = Radio()
+	module.Network = Network
+	return module
+
+
+def make_socketpool_module(network):
+	module = types.ModuleType("socketpool")
+
+	class Socket:
+		def __init__(self, pool, family, type):
+			self.pool = pool
+			self.timeout = None
+			self.reply = None
+
+		def settimeout(self, timeout):
+			self.timeout = timeout
+
+		def setblocking(self, flag):
+			self.timeout = None if flag else 0
+
+		def sendto(self, data, address):
+			# like the board, a host name is resolved by sendto()
+			host = network.host_name(network.resolve(address[0]))
+			if address[1] == 123:
+				self.reply = network.ntp_reply(host, data)
+			return len(data)
+
+		def recvfrom_into(self, buffer, nbytes=0):
+			if self.reply is None:
+				if self.timeout:
+					network.clock.advance(self.timeout * 1_000_000_000)
+				raise OSError(11, "EAGAIN")
+			size = min(len(buffer), len(self.reply))
+			buffer[:size] = self.reply[:size]
+			self.reply = None
+			return size, ("127.0.0.1", 123)
+
+		def recv_into(self, buffer, nbytes=0):
+			return self.recvfrom_into(buffer, nbytes)[0]
+
+		def close(self):
+			pass
+
+		def __enter__(self):
+			return self
+
+		def __exit__(self, *args):
+			self.close()
+
+	class SocketPool:
+		AF_INET = 2
+		SOCK_STREAM = 1
+		SOCK_DGRAM = 2
+		IPPROTO_TCP = 6
+		IPPROTO_UDP = 17
+
+		def __init__(self, radio):
+			self.radio = radio
+
+		def socket(self, family=2, type=1, proto=0):
+			if not self.radio.connected:
+				raise OSError(113, "ECONNABORTED")
+			return Socket(self, family, type)
+
+		def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+			return [(self.AF_INET, type, proto, "", (network.resolve(host), port))]
+
+	module.SocketPool = SocketPool
+	return module
+
+
+####################################################################
+# adafruit_requests
+####################################################################
+
+class Response:
+	"""The parts of adafruit_requests.Response used by the programs"""
+
+	def __init__(self, connection, response):
+		self._connection = connection
+		self._response = response
+		self.status_code = response.status
+		self.reason = response.reason
+		self.headers = {key.lower(): value for key, value in response.getheaders()}
+		self._content = None
+
+	@property
+	def content(self):
+		if self._content is None:
+			self._content = self._response.read()
+		return self._content
+
+	@property
+	def text(self):
+		return self.content.decode("utf8")
+
+	def json(self):
+		return json_module.loads(self.content)
+
+	def iter_content(self, chunk_size=1, decode_unicode=False):
+		while True:
+			chunk = self._response.read(chunk_size)
+			if not chunk:
+				break
+			yield chunk.decode("utf8") if decode_unicode else chunk
+
+	def close(self):
+		self._response.close()
+		self._connection.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+
+def make_requests_module(network):
+	module = types.ModuleType("adafruit_requests")
+
+	class Session:
+		def __init__(self, socket_pool, ssl_context=None, session_id=None):
+			self._socket_pool = socket_pool
+			self.requests = 0
+
+		def request(self, method, url, data=None, json=None, headers=None,
+				stream=False, timeout=60):
+			if not self._socket_pool.radio.connected:
+				raise OSError(113, "ECONNABORTED")
+			parts = urllib.parse.urlsplit(url)
+			if parts.scheme == "https":
+				connection = http.client.HTTPSConnection(parts.netloc, timeout=timeout)
+			else:
+				connection = http.client.HTTPConnection(parts.netloc, timeout=timeout)
+			body = data
+			headers = dict(headers or {})
+			if json is not None:
+				body = json_module.dumps(json)
+				headers["Content-Type"] = "application/json"
+			path = parts.path or "/"
+			if parts.query:
+				path += "?" + parts.query
+			self.requests += 1
+
+			def send(timeout):
+				connection.request(method, path, body=body, headers=headers)
+				return connection.getresponse()
+
+			# the board waits for the answer, the time passes
+			return Response(connection, network.clock.wait_host(send, None))
+
+		def get(self, url, **kwargs):
+			return self.request("GET", url, **kwargs)
+
+		def post(self, url, **kwargs):
+			return self.request("POST", url, **kwargs)
+
+	module.Session = Session
+	return module
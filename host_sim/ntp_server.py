@@ -0,0 +1,84 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+A local UDP NTP server, to test the NTP client with the socket module.
+It answers with the host time, plus an offset, after a delay.
+
+	python -m host_sim.ntp_server --offset 1.5 --delay 0.02
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+
+from .network import make_ntp_reply
+from .simulation import REPO
+
+
+class StandInNTPServer:
+	"""Serve NTP on 127.0.0.1 in a thread"""
+
+	def __init__(self, offset=0.0, delay=0.0, stratum=2, port=0):
+		self.offset = offset
+		self.delay = delay
+		self.stratum = stratum
+		self.requests = 0
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.sock.bind(("127.0.0.1", port))
+		self.thread = None
+
+	@property
+	def port(self):
+		return self.sock.getsockname()[1]
+
+	def now(self):
+		return time.time() + self.offset
+
+	def serve(self):
+		while True:
+			try:
+				request, address = self.sock.recvfrom(512)
+			except OSError:
+				# the socket was closed
+				break
+			self.requests += 1
+			# half of the delay on the way in, half on the way out
+			time.sleep(self.delay / 2)
+			now = self.now()
+			reply = make_ntp_reply(request, now, now, self.stratum)
+			time.sleep(self.delay / 2)
+			self.sock.sendto(reply, address)
+
+	def start(self):
+		self.thread = threading.Thread(target=self.serve, daemon=True)
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.sock.close()
+
+
+def main():
+	parser = argparse.ArgumentParser(prog="python -m host_sim.ntp_server", description=__doc__.strip().splitlines()[0])
+	parser.add_argument("--offset", type=float, default=0.0, help="time error of the server in seconds")
+	parser.add_argument("--delay", type=float, default=0.0, help="round trip of the requests in seconds")
+	parser.add_argument("--samples", type=int, default=4, help="samples taken by the client")
+	args = parser.parse_args()
+
+	sys.path.insert(0, os.path.join(REPO, "simple_clock"))
+	from ntp_client import NTPClient
+
+	server = StandInNTPServer(args.offset, args.delay).start()
+	client = NTPClient(socket, ("127.0.0.1",), samples=args.samples, port=server.port)
+	sample = asyncio.run(client.sync_async())
+	error = (sample.time_ns() - time.time_ns()) / 1_000_000_000 - args.offset
+	print(sample)
+	print(f"offset measured: {error * 1000:+.3f} ms from the server's")
+	server.stop()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,168 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+Stand-ins for the CircuitPython runtime modules: rtc, supervisor,
+microcontroller, usb and storage, micropython, plus adafruit_datetime
+on the virtual RTC, the secrets module, and the asyncio of the board.
+"""
+import asyncio as host_asyncio
+import datetime as host_datetime
+import sys
+import types
+
+from .clock import SimulationEnd
+
+
+def make_rtc_module(clock):
+	module = types.ModuleType("rtc")
+
+	class RTC:
+		@property
+		def datetime(self):
+			return sys.modules["time"].localtime()
+
+		@datetime.setter
+		def datetime(self, value):
+			clock.set_rtc(value)
+
+	module.RTC = RTC
+	module.set_time_source = lambda source: None
+	return module
+
+
+def make_supervisor_module(clock):
+	module = types.ModuleType("supervisor")
+
+	def reload():
+		raise SimulationEnd("supervisor.reload()")
+
+	module.reload = reload
+	module.set_usb_identification = lambda **kwargs: None
+	module.ticks_ms = lambda: (clock.monotonic_ns() // 1_000_000) & ((1 << 29) - 1)
+	module.runtime = types.SimpleNamespace(serial_connected=True, usb_connected=True)
+	return module
+
+
+class NVMByteArray:
+	"""
+	microcontroller.nvm, only indexing and slicing like the real one:
+	it has no buffer protocol, struct.unpack_from() fails on it.
+	"""
+
+	def __init__(self, size):
+		self._data = bytearray(size)
+
+	def __len__(self):
+		return len(self._data)
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return bytearray(self._data[index])
+		return self._data[index]
+
+	def __setitem__(self, index, value):
+		if isinstance(index, slice):
+			start, stop, step = index.indices(len(self._data))
+			if step != 1 or len(value) != max(stop - start, 0):
+				raise ValueError("Slice and value have different lengths")
+		self._data[index] = value
+
+
+def make_microcontroller_module(nvm):
+	module = types.ModuleType("microcontroller")
+
+	def reset():
+		raise SimulationEnd("microcontroller.reset()")
+
+	module.nvm = nvm
+	module.reset = reset
+	module.cpu = types.SimpleNamespace(temperature=42.0, frequency=240_000_000)
+	return module
+
+
+def make_usb_modules():
+	usb_cdc = types.ModuleType("usb_cdc")
+	usb_cdc.console = sys.stdout
+	usb_cdc.data = None
+	usb_cdc.enable = lambda console=True, data=False: None
+	storage = types.ModuleType("storage")
+	storage.disable_usb_drive = lambda: None
+	storage.enable_usb_drive = lambda: None
+	storage.remount = lambda path, readonly=False, **kwargs: None
+	usb_midi = types.ModuleType("usb_midi")
+	usb_midi.disable = lambda: None
+	usb_hid = types.ModuleType("usb_hid")
+	usb_hid.disable = lambda: None
+	return {
+		"usb_cdc": usb_cdc,
+		"storage": storage,
+		"usb_midi": usb_midi,
+		"usb_hid": usb_hid,
+	}
+
+
+def make_micropython_module():
+	module = types.ModuleType("micropython")
+	module.const = lambda value: value
+	module.native = lambda function: function
+	module.viper = lambda function: function
+	return module
+
+
+def make_typing_module():
+	"""Only used by the type annotations of the Adafruit libraries"""
+	module = types.ModuleType("circuitpython_typing")
+	module.ReadableBuffer = bytes
+	module.WriteableBuffer = bytearray
+	return module
+
+
+def make_datetime_module():
+	"""adafruit_datetime, with now() from the virtual RTC"""
+	module = types.ModuleType("adafruit_datetime")
+
+	class datetime(host_datetime.datetime):
+		@classmethod
+		def now(cls, tz=None):
+			return cls(*sys.modules["time"].localtime()[:6])
+
+	module.datetime = datetime
+	module.timedelta = host_datetime.timedelta
+	module.date = host_datetime.date
+	module.time = host_datetime.time
+	module.timezone = host_datetime.timezone
+	return module
+
+
+"""The API of the asyncio library of CircuitPython, from the one of the host."""
+ASYNCIO_NAMES = (
+	"CancelledError", "Event", "Lock", "Task", "TimeoutError", "create_task",
+	"current_task", "gather", "get_event_loop", "new_event_loop",
+	"open_connection", "run", "sleep", "start_server", "wait_for",
+)
+
+
+def make_asyncio_module():
+	"""
+	asyncio with only what CircuitPython has: no threads (to_thread,
+	run_in_executor), the programs take the same paths as on the board.
+	"""
+	module = types.ModuleType("asyncio")
+	for name in ASYNCIO_NAMES:
+		setattr(module, name, getattr(host_asyncio, name))
+
+	async def sleep_ms(milliseconds):
+		await host_asyncio.sleep(milliseconds / 1000)
+
+	def wait_for_ms(awaitable, timeout):
+		return host_asyncio.wait_for(awaitable, timeout / 1000)
+
+	module.sleep_ms = sleep_ms
+	module.wait_for_ms = wait_for_ms
+	return module
+
+
+def make_secrets_module(secrets):
+	module = types.ModuleType("secrets")
+	module.secrets = secrets
+	return module
@@ -0,0 +1,189 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+Run the WOPR programs unmodified on the host, with stand-ins for the
+CircuitPython modules and a virtual clock.
+"""
+import asyncio
+import calendar
+import importlib
+import os
+import random
+import runpy
+import sys
+import time as host_time
+
+from .clock import SimulationEnd, VirtualClock
+from .event_loop import VirtualEventLoopPolicy
+from .hardware import (
+	ButtonScript, I2CBus, VirtualDisplay, VirtualHT16K33,
+	make_board_module, make_busio_module, make_digitalio_module,
+	make_keypad_module, make_neopixel_module,
+)
+from .http_server import StandInServer
+from .network import (
+	FakeNetwork, make_requests_module, make_socketpool_module, make_wifi_module,
+)
+from .runtime import (
+	NVMByteArray, make_asyncio_module, make_datetime_module, make_microcontroller_module,
+	make_micropython_module, make_rtc_module, make_secrets_module,
+	make_supervisor_module, make_typing_module, make_usb_modules,
+)
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMON = os.path.join(REPO, "common")
+# 2023-06-01 12:00:00 UTC
+DEFAULT_START = calendar.timegm((2023, 6, 1, 12, 0, 0))
+# the RTC of a board that was never set
+UNSET_RTC = calendar.timegm((2000, 1, 1, 0, 0, 0))
+DISPLAY_ADDRESSES = (0x70, 0x72, 0x74)
+# imported before time is replaced, so that they keep the real one
+HOST_MODULES = (
+	"asyncio", "datetime", "gc", "hashlib", "heapq", "http.client", "json",
+	"math", "random", "socket", "ssl", "struct", "threading", "traceback",
+)
+
+
+class Simulation:
+	"""The simulated board, its devices and the network around it"""
+
+	def __init__(self, start_time=DEFAULT_START, rtc_set=True, cpu_scale=0.0,
+			drift_ppm=0.0, secrets=None, seed=None, version=(8, 2, 0)):
+		self.clock = VirtualClock(start_time, cpu_scale, drift_ppm)
+		if not rtc_set:
+			self.clock.rtc_base = UNSET_RTC
+		self.bus = I2CBus(self.clock)
+		self.backpacks = [VirtualHT16K33(address) for address in DISPLAY_ADDRESSES]
+		for backpack in self.backpacks:
+			self.bus.add_device(backpack)
+		self.display = None
+		self.buttons = ButtonScript(self.clock)
+		self.pixels = {}
+		self.network = FakeNetwork(self.clock)
+		self.nvm = NVMByteArray(8192)
+		self.http = StandInServer()
+		self.secrets = {
+			"ssid": self.network.ssid,
+			"password": "joshua",
+			"NET_TEST": None,
+			"TZ_OFFSET": 0,
+		}
+		self.secrets.update(secrets or {})
+		self.seed = seed
+		self.version = version
+		self.end_reason = None
+		self._saved_modules = None
+
+	def press(self, pin, at, duration=0.1):
+		"""Press the button on that pin (like "IO38") at a time in seconds"""
+		self.buttons.press(pin, at, duration)
+
+	def pixel_shows(self):
+		"""Number of show() of all the NeoPixels"""
+		return sum(
+			recorder.shows
+			for recorders in self.pixels.values()
+			for recorder in recorders
+		)
+
+	def make_modules(self):
+		clock = self.clock
+		modules = {
+			"time": clock.make_time_module(),
+			"board": make_board_module(),
+			"busio": make_busio_module(self.bus),
+			"digitalio": make_digitalio_module(self.buttons),
+			"keypad": make_keypad_module(self.buttons, clock),
+			"neopixel": make_neopixel_module(self.pixels, clock),
+			"wifi": make_wifi_module(self.network),
+			"socketpool": make_socketpool_module(self.network),
+			"adafruit_requests": make_requests_module(self.network),
+			"rtc": make_rtc_module(clock),
+			"supervisor": make_supervisor_module(clock),
+			"microcontroller": make_microcontroller_module(self.nvm),
+			"micropython": make_micropython_module(),
+			"adafruit_datetime": make_datetime_module(),
+			"secrets": make_secrets_module(self.secrets),
+			"asyncio": make_asyncio_module(),
+		}
+		modules.update(make_usb_modules())
+		try:
+			importlib.import_module("circuitpython_typing")
+		except ImportError:
+			modules["circuitpython_typing"] = make_typing_module()
+		return modules
+
+	def install(self):
+		"""Put the stand-in modules in sys.modules"""
+		for name in HOST_MODULES:
+			importlib.import_module(name)
+		self.http.start()
+		if self.secrets["NET_TEST"] is None:
+			# the last network test was an hour before the start
+			date = host_time.strftime(
+				"%Y-%m-%dT%H:%M:%S", host_time.gmtime(self.clock.true_start - 3600)
+			)
+			self.http.set_route("/nettest", f'[{{"date": "{date}", "ok": true}}]')
+			self.secrets["NET_TEST"] = self.http.url("/nettest")
+		self._known_modules = set(sys.modules)
+		modules = self.make_modules()
+		self._saved_modules = {name: sys.modules.get(name) for name in modules}
+		sys.modules.update(modules)
+		self._saved_version = sys.implementation.version
+		sys.implementation.version = self.version
+		if self.seed is not None:
+			random.seed(self.seed)
+		asyncio.set_event_loop_policy(VirtualEventLoopPolicy(self.clock))
+		# the display decodes the segments with the glyphs of the programs
+		if COMMON not in sys.path:
+			sys.path.append(COMMON)
+		from segment_display import GLYPHS
+		self.display = VirtualDisplay(self.backpacks, self.clock, GLYPHS)
+		self.bus.on_write = self.display.record
+
+	def uninstall(self):
+		"""Restore the host modules and forget the ones the program imported"""
+		sys.implementation.version = self._saved_version
+		asyncio.set_event_loop_policy(None)
+		for name in set(sys.modules) - self._known_modules:
+			del sys.modules[name]
+		for name, module in self._saved_modules.items():
+			if module is None:
+				sys.modules.pop(name, None)
+			else:
+				sys.modules[name] = module
+		self.http.stop()
+
+	def run(self, path, seconds):
+		"""Run a program for that many simulated seconds"""
+		path = os.path.abspath(path)
+		app_dir = os.path.dirname(path)
+		saved_path = list(sys.path)
+		saved_cwd = os.getcwd()
+		self.clock.limit_ns = self.clock.now_ns + int(seconds * 1_000_000_000)
+		sys.path[:0] = [app_dir, COMMON]
+		self.install()
+		try:
+			os.chdir(app_dir)
+			runpy.run_path(path, run_name="__main__")
+			self.end_reason = "program ended"
+		except SimulationEnd as end:
+			self.end_reason = str(end)
+		finally:
+			os.chdir(saved_cwd)
+			self.uninstall()
+			sys.path[:] = saved_path
+		return self.summary()
+
+	def summary(self):
+		return {
+			"seconds": self.clock.now_ns / 1_000_000_000,
+			"end": self.end_reason,
+			"sleep_seconds": self.clock.sleep_ns / 1_000_000_000,
+			"i2c_transactions": self.bus.transactions,
+			"i2c_bytes": self.bus.bytes,
+			"pixel_shows": self.pixel_shows(),
+			"wifi_connections": self.network.connections,
+			"ntp_requests": self.network.ntp_requests,
+			"display": self.display.text() if self.display else "",
+		}
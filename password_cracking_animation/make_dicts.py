@@ -1,30 +1,469 @@
 #!/bin/bash
 
 import argparse
+import bz2
+import glob
+import gzip
+import heapq
+import lzma
+import math
+import multiprocessing
 import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
 
-parser = argparse.ArgumentParser()
-parser.add_argument("dictionary", type=str, help="Dictionary file one word per line")
-args = parser.parse_args()
-
-dictionary = args.dictionary
+from word_store import (
+	ALIAS_ENTRY, PACK_ENTRY, PACK_HEADER, PACK_MAGIC, PACK_VERSION,
+	AliasTable, record_size,
+)
 
 MAX_LEN = 12
-passwords = [set() for i in range(MAX_LEN + 1)]
+# rough memory used by a word in a set, on top of its characters
+WORD_OVERHEAD = 80
+# number of run files merged at once
+MERGE_FAN_IN = 64
+# plain text files are split in chunks of that size between processes
+CHUNK_SIZE = 64_000_000
+OPENERS = {
+	".gz": gzip.open,
+	".bz2": bz2.open,
+	".xz": lzma.open,
+}
+
+
+class Progress:
+	"""Print the bytes and words read, at most once per second"""
+
+	def __init__(self, total_bytes=0):
+		self.total_bytes = total_bytes
+		self.bytes = 0
+		self.words = 0
+		self.start = time.monotonic()
+		self.last = self.start
+
+	def update(self, num_bytes, num_words):
+		self.bytes += num_bytes
+		self.words += num_words
+		now = time.monotonic()
+		if now - self.last >= 1:
+			self.last = now
+			self.print(end="\r")
+
+	def print(self, end="\n"):
+		elapsed = max(time.monotonic() - self.start, 0.001)
+		megs = self.bytes / 1_000_000
+		if self.total_bytes:
+			percent = f" ({100 * self.bytes / self.total_bytes:.0f}%)"
+		else:
+			percent = ""
+		print(
+			f"{megs:.1f} MB{percent} {self.words} lines"
+			f" {megs / elapsed:.1f} MB/s {self.words / elapsed:.0f} lines/s",
+			end=end, file=sys.stderr, flush=True,
+		)
+
+
+def normalize(line, columns=None):
+	"""
+	The word and frequency of a line, or None if it doesn't fit on the
+	display. columns is (delimiter, word column, frequency column).
+	"""
+	frequency = 1
+	if columns:
+		delimiter, word_column, freq_column = columns
+		fields = line.split(delimiter)
+		try:
+			line = fields[word_column]
+			frequency = float(fields[freq_column])
+		except (IndexError, ValueError):
+			return None
+		# a weight can't be negative, nan or infinite
+		if not math.isfinite(frequency) or frequency < 0:
+			return None
+	word = line.strip().lower()
+	if not 0 < len(word) <= MAX_LEN:
+		return None
+	# printable ascii, without the dot that is merged with the previous digit
+	if not (word.isascii() and word.isprintable()) or "." in word:
+		return None
+	return (word, frequency)
+
+
+def is_compressed(dictionary):
+	return os.path.splitext(dictionary)[1].lower() in OPENERS
+
+
+def open_dictionary(dictionary):
+	"""Open a dictionary file in binary mode, compressed or not"""
+	extension = os.path.splitext(dictionary)[1].lower()
+	return OPENERS.get(extension, open)(dictionary, "rb")
+
+
+def split_tasks(dictionaries):
+	"""Split the dictionaries in (path, start, end) chunks of lines"""
+	tasks = []
+	for dictionary in dictionaries:
+		size = os.path.getsize(dictionary)
+		if is_compressed(dictionary) or size <= CHUNK_SIZE:
+			tasks.append((dictionary, 0, None))
+		else:
+			for start in range(0, size, CHUNK_SIZE):
+				tasks.append((dictionary, start, start + CHUNK_SIZE))
+	return tasks
+
+
+def read_lines(dictionary, start, end):
+	"""
+	Yield the lines that start between start and end,
+	or all of them if end is None.
+	"""
+	with open_dictionary(dictionary) as input_file:
+		position = start
+		if start > 0:
+			# skip the end of the line that belongs to the previous chunk
+			input_file.seek(start - 1)
+			position += len(input_file.readline()) - 1
+		for line in input_file:
+			if end is not None and position >= end:
+				break
+			position += len(line)
+			yield line
+
+
+def bucket_words(task):
+	"""
+	Read a chunk of a dictionary and bucket its words by size.
+	In memory, return the frequencies of the words, otherwise the run files.
+	"""
+	dictionary, start, end, columns, temp_dir, memory_limit = task
+	num_bytes = 0
+	num_lines = 0
+	if temp_dir:
+		buckets = SpillBuckets(tempfile.mkdtemp(dir=temp_dir), memory_limit)
+		add = buckets.add
+	else:
+		buckets = [{} for i in range(MAX_LEN + 1)]
+	for line in read_lines(dictionary, start, end):
+		num_bytes += len(line)
+		num_lines += 1
+		entry = normalize(line.decode("utf8", errors="replace"), columns)
+		if entry is None: continue
+		word, frequency = entry
+		if temp_dir:
+			add(word, frequency)
+		else:
+			bucket = buckets[len(word)]
+			bucket[word] = bucket.get(word, 0) + frequency
+	if is_compressed(dictionary):
+		# the progress is in bytes of the files, the whole file was read
+		num_bytes = os.path.getsize(dictionary)
+	if temp_dir:
+		buckets.spill()
+		return (buckets.runs, num_bytes, num_lines)
+	return (buckets, num_bytes, num_lines)
+
+
+def run_tasks(tasks, jobs, progress):
+	"""Yield the results of the tasks, in a pool of processes if jobs > 1"""
+	if jobs > 1 and len(tasks) > 1:
+		with multiprocessing.Pool(min(jobs, len(tasks))) as pool:
+			for result, num_bytes, num_lines in pool.imap_unordered(bucket_words, tasks):
+				progress.update(num_bytes, num_lines)
+				yield result
+	else:
+		for task in tasks:
+			result, num_bytes, num_lines = bucket_words(task)
+			progress.update(num_bytes, num_lines)
+			yield result
+
+
+def write_words(directory, size, words, weighted=False):
+	"""
+	Write the sorted (word, frequency) of one size, return how many.
+	The frequencies go in a freqs-N.txt file used to make the pack.
+	"""
+	count = 0
+	with open(f"{directory}/words-{size}.txt", "w") as fp:
+		if weighted:
+			freqs = open(f"{directory}/freqs-{size}.txt", "w")
+		try:
+			for word, frequency in words:
+				fp.write(word+"\n")
+				if weighted:
+					freqs.write(f"{frequency:g}\n")
+				count += 1
+		finally:
+			if weighted:
+				freqs.close()
+	return count
+
+
+def build_in_memory(tasks, jobs, progress, directory, weighted):
+	"""Keep all the words in memory, sort them and write them"""
+	passwords = [{} for i in range(MAX_LEN + 1)]
+	tasks = [task + (None, 0) for task in tasks]
+	for buckets in run_tasks(tasks, jobs, progress):
+		for size, words in enumerate(buckets):
+			bucket = passwords[size]
+			for word, frequency in words.items():
+				bucket[word] = bucket.get(word, 0) + frequency
+	for size, words in enumerate(passwords):
+		if len(words) == 0: continue
+		write_words(directory, size, sorted(words.items()), weighted)
+
+
+class SpillBuckets:
+	"""
+	Words and frequencies by size in memory, written to sorted run files
+	when they use more than memory_limit bytes.
+	"""
+
+	def __init__(self, temp_dir, memory_limit):
+		self.temp_dir = temp_dir
+		self.memory_limit = memory_limit
+		self.buckets = [{} for i in range(MAX_LEN + 1)]
+		self.runs = [[] for i in range(MAX_LEN + 1)]
+		self.used = 0
+		self.num_runs = 0
+
+	def add(self, word, frequency=1):
+		bucket = self.buckets[len(word)]
+		if word in bucket:
+			bucket[word] += frequency
+		else:
+			bucket[word] = frequency
+			self.used += len(word) + WORD_OVERHEAD
+			if self.used > self.memory_limit:
+				self.spill()
+
+	def spill(self):
+		"""Write each bucket as a sorted run and empty it"""
+		for size, bucket in enumerate(self.buckets):
+			if len(bucket) == 0: continue
+			self.runs[size].append(self.write_run(sorted(bucket.items())))
+			bucket.clear()
+		self.used = 0
+
+	def write_run(self, words):
+		"""
+		Write sorted (word, frequency) as tab separated lines.
+		The tab sorts before any word character, so lines sort like words.
+		"""
+		path = os.path.join(self.temp_dir, f"run-{self.num_runs}.txt")
+		self.num_runs += 1
+		with open(path, "w") as fp:
+			for word, frequency in words:
+				fp.write(f"{word}\t{frequency!r}\n")
+		return path
+
+	def merged(self, size):
+		"""Sorted unique (word, frequency) of that size, merged from the runs"""
+		runs = self.runs[size]
+		# merge in several passes to limit the number of open files
+		while len(runs) > MERGE_FAN_IN:
+			runs = [
+				self.write_run(merge_runs(runs[i:i + MERGE_FAN_IN]))
+				for i in range(0, len(runs), MERGE_FAN_IN)
+			]
+		return merge_runs(runs)
+
+
+def merge_runs(paths):
+	"""Merge sorted run files, adding the frequencies of duplicates"""
+	files = [open(path, "r") for path in paths]
+	try:
+		previous = None
+		total = 0
+		for line in heapq.merge(*files):
+			word, frequency = line[:-1].split("\t")
+			if word != previous:
+				if previous is not None:
+					yield (previous, total)
+				previous = word
+				total = 0
+			total += float(frequency)
+		if previous is not None:
+			yield (previous, total)
+	finally:
+		for fp in files:
+			fp.close()
+
+
+def build_streaming(tasks, jobs, progress, directory, memory_limit, weighted):
+	"""Bucket the words in run files and merge them, with bounded memory"""
+	temp_dir = tempfile.mkdtemp(prefix="make_dicts-")
+	try:
+		# the memory limit is shared between the processes
+		memory_limit = memory_limit // max(1, min(jobs, len(tasks)))
+		tasks = [task + (temp_dir, memory_limit) for task in tasks]
+		buckets = SpillBuckets(temp_dir, memory_limit)
+		for runs in run_tasks(tasks, jobs, progress):
+			for size in range(MAX_LEN + 1):
+				buckets.runs[size] += runs[size]
+		progress.print()
+		for size in range(MAX_LEN + 1):
+			if len(buckets.runs[size]) == 0: continue
+			count = write_words(directory, size, buckets.merged(size), weighted)
+			print(f"words-{size}.txt: {count} words", file=sys.stderr)
+	finally:
+		shutil.rmtree(temp_dir)
+
+
+def read_word_files(directory):
+	"""The words-N.txt files, by size"""
+	word_files = {}
+	for path in glob.glob(os.path.join(directory, "words-*.txt")):
+		size = int(os.path.basename(path)[6:-4])
+		word_files[size] = path
+	return dict(sorted(word_files.items()))
+
+
+def remove_word_files(directory):
+	"""Remove the words-N.txt and freqs-N.txt of an earlier build"""
+	for pattern in ("words-*.txt", "freqs-*.txt"):
+		for path in glob.glob(os.path.join(directory, pattern)):
+			os.remove(path)
+
+
+def read_frequencies(directory, size):
+	"""The frequencies of the words of that size, None if there are none"""
+	path = os.path.join(directory, f"freqs-{size}.txt")
+	if not os.path.exists(path):
+		return None
+	with open(path, "r") as fp:
+		return [float(line) for line in fp]
+
+
+def pack_word(word, bits, codes):
+	"""The bytes of a word, bits per character from the most significant bit"""
+	if bits == 8:
+		return word.encode("ascii")
+	value = 0
+	for char in word:
+		value = (value << bits) | codes[char]
+	padding = record_size(len(word), bits) * 8 - len(word) * bits
+	return (value << padding).to_bytes(record_size(len(word), bits), "big")
+
+
+def write_pack(directory, filename, bits=None):
+	"""Write the words of the text files to a single pack file"""
+	word_files = read_word_files(directory)
+	charset = set()
+	counts = {}
+	for size, path in word_files.items():
+		with open(path, "r") as fp:
+			counts[size] = 0
+			for line in fp:
+				charset.update(line[:-1])
+				counts[size] += 1
+	charset = "".join(sorted(charset))
+	# smallest number of bits per character that fits the set
+	if bits is None:
+		bits = next(bits for bits in (5, 6, 8) if len(charset) <= 2 ** bits)
+	elif bits < 8 and len(charset) > 2 ** bits:
+		raise ValueError(f"{len(charset)} characters don't fit in {bits} bits")
+	if bits == 8:
+		charset = ""
+	codes = {char: code for code, char in enumerate(charset)}
+
+	offset = (
+		struct.calcsize(PACK_HEADER) + len(charset)
+		+ struct.calcsize(PACK_ENTRY) * len(word_files)
+	)
+	records_size = sum(
+		counts[size] * record_size(size, bits) for size in word_files
+	)
+	table_offset = offset + records_size
+	tables = {}
+	with open(filename, "wb") as fp:
+		fp.write(struct.pack(PACK_HEADER, PACK_MAGIC, PACK_VERSION, bits, len(word_files), len(charset)))
+		fp.write(charset.encode("ascii"))
+		for size in word_files:
+			frequencies = read_frequencies(directory, size)
+			if frequencies is not None and len(frequencies) != counts[size]:
+				raise ValueError(
+					f"freqs-{size}.txt has {len(frequencies)} lines"
+					f" for {counts[size]} words"
+				)
+			if frequencies is None:
+				weight = counts[size]
+			else:
+				weight = sum(frequencies)
+			if frequencies and weight > 0:
+				tables[size] = AliasTable(None, frequencies)
+				fp.write(struct.pack(PACK_ENTRY, size, counts[size], offset, table_offset, weight))
+				table_offset += counts[size] * struct.calcsize(ALIAS_ENTRY)
+			else:
+				# all the frequencies are 0: no table, the size is never picked
+				fp.write(struct.pack(PACK_ENTRY, size, counts[size], offset, 0, weight))
+			offset += counts[size] * record_size(size, bits)
+		for size, path in word_files.items():
+			with open(path, "r") as words:
+				for line in words:
+					fp.write(pack_word(line[:-1], bits, codes))
+		# probabilities in 16 bits and aliases of the weighted sizes
+		for size, table in tables.items():
+			for prob, alias in zip(table.prob, table.alias):
+				fp.write(struct.pack(ALIAS_ENTRY, min(65535, round(prob * 65536)), alias))
+	print(f"{filename}: {sum(counts.values())} words, {bits} bits per character", file=sys.stderr)
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("dictionaries", type=str, nargs="+",
+		help="Dictionary files one word per line, can be .gz .bz2 or .xz")
+	parser.add_argument("--output", type=str, default="words",
+		help="Output directory, and name of the pack file without .bin")
+	parser.add_argument("--format", choices=("text", "pack", "both"), default="text",
+		help="A words-N.txt file per size, a single pack file, or both")
+	parser.add_argument("--bits", type=int, choices=(5, 6, 8), default=None,
+		help="Bits per character in the pack file, the smallest possible by default")
+	parser.add_argument("--streaming", action="store_true",
+		help="Sort the words in temporary files, for lists that don't fit in memory")
+	parser.add_argument("--memory", type=int, default=256,
+		help="Memory limit in MB in streaming mode")
+	parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+		help="Number of processes reading the dictionaries")
+	parser.add_argument("--freq-column", type=int, default=None,
+		help="Column of the word frequencies, starting at 1, to weight the words in the pack")
+	parser.add_argument("--word-column", type=int, default=1,
+		help="Column of the words when there are frequencies")
+	parser.add_argument("--delimiter", type=str, default="\t",
+		help="Column delimiter when there are frequencies")
+	args = parser.parse_args()
+
+	if args.format == "pack":
+		# the text files are only used to make the pack
+		text_dir = tempfile.mkdtemp(prefix="make_dicts-")
+	else:
+		text_dir = args.output
+		os.makedirs(text_dir, exist_ok=True)
+		# the files of other sizes or the frequencies would go in the pack
+		remove_word_files(text_dir)
 
-with open(dictionary, "r") as input_file:
-	for line in input_file:
-		word = line.strip().lower()
-		if len(word) <= MAX_LEN:
-			passwords[len(word)].add(word)
+	weighted = args.freq_column is not None
+	if weighted:
+		columns = (args.delimiter, args.word_column - 1, args.freq_column - 1)
+	else:
+		columns = None
 
-os.makedirs("words")
+	try:
+		tasks = [task + (columns,) for task in split_tasks(args.dictionaries)]
+		progress = Progress(sum(os.path.getsize(path) for path in args.dictionaries))
+		if args.streaming:
+			build_streaming(tasks, args.jobs, progress, text_dir, args.memory * 1_000_000, weighted)
+		else:
+			build_in_memory(tasks, args.jobs, progress, text_dir, weighted)
+			progress.print()
+		if args.format != "text":
+			write_pack(text_dir, args.output + ".bin", args.bits)
+	finally:
+		if args.format == "pack":
+			shutil.rmtree(text_dir)
 
-for words in passwords:
-	if len(words) == 0: continue
-	words = sorted(words)
-	wlen = len(words[0])
 
-	with open(f"words/words-{wlen}.txt", "w") as fp:
-		for word in words:
-			fp.write(word+"\n")
+if __name__ == "__main__":
+	main()
@@ -2,23 +2,29 @@
 # SPDX-License-Identifier: MIT
 """
 Pick random "passwords", scroll random characters, decode the password.
-- The probability of a character being decoded in each loop is a function
-  of TIME_DECODING and other parameters to get a reasonnable average time.
-- Increases the probability of decoding the longer it goes above the target time.
+- The time when each character is decoded is picked with the password,
+  with a decoding rate that is a function of TIME_DECODING and other
+  parameters to get a reasonnable average time.
+- The rate increases the longer it goes above the target time.
 - Button A decodes a character.
 - Button B resets the decoding session (not the password).
 """
 import board
 import busio
+import gc
 import keypad
-import os
+import math
 import random
+import supervisor
 import time
 import wifi
 
-import adafruit_ht16k33.segments
 import neopixel
 
+from frame_scheduler import TicksFrameScheduler, ticks_diff
+from segment_display import SegmentDisplay
+from word_store import open_words
+
 """
 When the scrolling character matches a password character, reveal.
 If False, just scrolls letters, pretty pointless.
@@ -26,10 +32,16 @@ If False, just scrolls letters, pretty pointless.
 FIND_MODE = True
 """Progressively increase the probabilities of instant decoding for a character"""
 ACCELERATE_WHEN_NOT_FOUND = True
-"""Loop sleep."""
+"""Frame period."""
 SPEED_DELAY = 0.01
 """Target time of decoding."""
 TIME_DECODING = 30
+"""Print the memory allocated by the frames that allocate (debug)."""
+CHECK_ALLOCATIONS = False
+"""Number of passwords generated in advance."""
+PREFETCH_SIZE = 4
+"""Time left in a frame needed to generate a password in advance."""
+PREFETCH_MARGIN = 0.005
 """
 If no word list files are available, use the list of builtins.
 If set to False, use completely a random word instead.
@@ -57,7 +69,7 @@ BUT1, BUT2, BUTA, BUTB = range(4)
 ####################################################################
 
 i2c = busio.I2C(sda=board.SDA, scl=board.SCL, frequency=400_000)
-display = adafruit_ht16k33.segments.Seg14x4(i2c, address=(0x70, 0x72, 0x74))
+display = SegmentDisplay(i2c, address=(0x70, 0x72, 0x74))
 
 pixels = neopixel.NeoPixel(board.IO7,5,auto_write = False)
 pixels.fill((0,0,0))
@@ -132,17 +144,8 @@ def make_password():
 				passe.append(random.choice(vowels))
 	return passe
 
-# get the word files and organize them by size
-password_files = [["",0]] * 14
-password_sizes = set()
-for x in range(14):
-	filename = f"words/words-{x}.txt"
-	try:
-		n_passwords = os.stat(filename)[6] // (x+1) # is gonna fail if not exists
-		password_files[x] = [filename, n_passwords]
-		password_sizes.add(x)
-	except OSError as err:
-		password_files[x] = ["", 0]
+# open the words pack or the word files once and index them by size
+word_store = open_words("words")
 
 def password_from_dict():
 	# make sizes
@@ -150,21 +153,15 @@ def password_from_dict():
 	words = []
 	# pick up to 3 random words that fit the size
 	while full_size < 12:
-		# pick a random word that fits in the remaining space
-		size = random.choice([
-			x for x in password_sizes
-			if x <= 12 - full_size
-		])
+		# pick the size of a word that fits in the remaining space
+		size = word_store.random_size(12 - full_size, 3 - len(words))
 		# get the word from the file
-		with open(password_files[size][0],"r") as fp:
-			pos_word = random.randint(0,password_files[size][1])
-			fp.seek( pos_word * ( size + 1 ) )
-			word = fp.read(size).strip().upper()
+		word = word_store.random_word(size).strip().upper()
 		# append and count the word
 		words.append(word)
 		full_size += len(word)
 		# stop when there's no space left or we already picked 3 words
-		if (12 - full_size) < min(password_sizes): break
+		if (12 - full_size) < word_store.min_size: break
 		if len(words) == 3: break
 	# add random characters
 	while full_size < 12:
@@ -175,7 +172,7 @@ def password_from_dict():
 	return "".join(words)
 
 def get_password():
-	if password_sizes:
+	if word_store:
 		# use files to get a password
 		password = password_from_dict()
 	elif USE_BUILTINS:
@@ -184,7 +181,32 @@ def get_password():
 	else:
 		# no files, generate random password
 		password = make_password()
-	return [x for x in password]
+	return "".join(password).encode()
+
+class PasswordQueue:
+	"""Passwords generated ahead of time, in a ring of buffers"""
+
+	def __init__(self, size):
+		self.passwords = [bytearray(12) for x in range(size)]
+		self.first = 0
+		self.count = 0
+
+	def fill(self):
+		"""Generate one password if there is room, return True if done"""
+		if self.count == len(self.passwords):
+			return False
+		index = (self.first + self.count) % len(self.passwords)
+		self.passwords[index][:] = get_password()
+		self.count += 1
+		return True
+
+	def take_into(self, password):
+		"""Copy the next password in the buffer, without I/O if not empty"""
+		if self.count == 0:
+			self.fill()
+		password[:] = self.passwords[self.first]
+		self.first = (self.first + 1) % len(self.passwords)
+		self.count -= 1
 
 ####################################################################
 # setup loop variables and parameters
@@ -192,88 +214,156 @@ def get_password():
 
 # chances_decoding * num_charas * TIME_DECODING / SPEED_DELAY = 1
 CHANCES_DECODING = len(charas) * SPEED_DELAY / (12 * TIME_DECODING)
+# the same chances as a rate per second, independent of the frame rate
+DECODING_RATE = CHANCES_DECODING / SPEED_DELAY
+# increase of the rate per second once above TIME_DECODING
+ACCELERATION = 0.001 / SPEED_DELAY / SPEED_DELAY
 average_time = 0
 
 print("CHANCES_DECODING", CHANCES_DECODING)
 
+def reveal_time():
+	"""Draw the time it takes to decode one character"""
+	# exponential draw of the cumulated decoding rate
+	target = -math.log(1.0 - random.random())
+	if not ACCELERATE_WHEN_NOT_FOUND or target <= DECODING_RATE * TIME_DECODING:
+		return target / DECODING_RATE
+	# after TIME_DECODING the rate increases linearly
+	excess = target - DECODING_RATE * TIME_DECODING
+	return TIME_DECODING + (
+		math.sqrt(DECODING_RATE * DECODING_RATE + 2 * ACCELERATION * excess)
+		- DECODING_RATE
+	) / ACCELERATION
+
+# when each character is decoded, sorted by time
+reveal_times = [0.0] * 12
+reveal_order = bytearray(12)
+next_reveal = 0
+
+def schedule_decoding(origin):
+	"""Pick the decoding time of each character, from origin in seconds"""
+	global next_reveal
+	for char in range(12):
+		when = origin + reveal_time()
+		# insertion sort, the characters follow their time
+		index = char
+		while index > 0 and reveal_times[index - 1] > when:
+			reveal_times[index] = reveal_times[index - 1]
+			reveal_order[index] = reveal_order[index - 1]
+			index -= 1
+		reveal_times[index] = when
+		reveal_order[index] = char
+	next_reveal = 0
+
+# the frame state is preallocated, a frame doesn't allocate memory
+ALL_DECODED = (1 << 12) - 1
+STAR = ord("*")
+charas_codes = charas.encode()
+# scrolling characters
+screen_texte = bytearray(random.choice(charas_codes) for x in range(12))
+# characters sent to the display
+frame = bytearray(12)
 # first password
-# password = [x for x in "MOUTARDE 007"]
-password = get_password()
-
-chances_decoding = CHANCES_DECODING
-screen_texte = [random.choice(charas) for x in range(12)]
+# password = bytearray(b"MOUTARDE 007")
+password = bytearray(get_password())
+next_passwords = PasswordQueue(PREFETCH_SIZE)
+# in ms, like the frames, long ints like monotonic_ns() would allocate
+prefetch_margin = int(PREFETCH_MARGIN * 1000)
+# bitmask of the decoded characters
+decoded = 0
+num_coded = 12
 ring = 0
-not_decoded = set(range(12))
+event = keypad.Event()
+
 defcon = 0
-start_time = time.monotonic_ns()
+start_time = supervisor.ticks_ms()
+schedule_decoding(0)
+frames = TicksFrameScheduler(SPEED_DELAY)
 
 ####################################################################
 # loop-dee-loop
 ####################################################################
 
 while True:
-	current_time = time.monotonic_ns()
-	took = (current_time - start_time) // 1000 // 1000 / 1000
-	precent_time = (TIME_DECODING - took) / TIME_DECODING
+	current_time = frames.wait()
+	took = ticks_diff(current_time, start_time) / 1000
+
+	if CHECK_ALLOCATIONS:
+		mem_free = gc.mem_free()
 
 	# scroll
 	ring = (ring + 1) % 12
-	screen_texte[ring] = random.choice(charas)
-	#
-	buff = ["."] * 12
+	screen_texte[ring] = random.choice(charas_codes)
 	still_coded = False
 
-	for char in range(12):
-		# reveal password characters that match the scrolling text
-		if FIND_MODE:
-			if random.random() < chances_decoding:
-				if char in not_decoded:
-					not_decoded.remove(char)
-					# a character can only match once
-					screen_texte[(ring+char)%12] = "*"
-					# force update the segment in case it's all decoded
-					still_coded |= True
-					# reset the autowin
-					chances_decoding = CHANCES_DECODING
+	# reveal password characters whose time has come
+	if FIND_MODE:
+		while next_reveal < 12 and reveal_times[next_reveal] <= took:
+			char = reveal_order[next_reveal]
+			next_reveal += 1
+			if not decoded & (1 << char):
+				decoded |= 1 << char
+				num_coded -= 1
+				# a character can only match once
+				screen_texte[(ring + char) % 12] = STAR
+				# force update the segment in case it's all decoded
+				still_coded |= True
 
+	for char in range(12):
+		position = (ring + char) % 12
 		# display scrolling or decoded character
-		if char in not_decoded:
-			still_coded |= True
-			buff[char] = screen_texte[(ring+char)%12]
+		if decoded & (1 << char):
+			frame[char] = password[char]
 		else:
-			buff[char] = password[char]
+			still_coded |= True
+			frame[char] = screen_texte[position]
 
 	# send I2C only if it's not finished
 	if still_coded:
-		display.print("".join(buff))
+		display.render(frame)
 
 	################################################################
 	# buttons
-	while event := buttons.events.get():
-		if event.pressed and event.key_number == BUTA:
+	while buttons.events.get_into(event):
+		if event.pressed and event.key_number == BUTA and num_coded:
 			# decode one character
-			num = random.choice(list(not_decoded))
-			not_decoded.remove(num)
-			screen_texte[(ring+num)%12] = "*"
+			num = random.randrange(12)
+			while decoded & (1 << num):
+				num = random.randrange(12)
+			decoded |= 1 << num
+			num_coded -= 1
+			screen_texte[(ring+num)%12] = STAR
 			print("Decode", num)
 		if event.pressed and event.key_number == BUTB:
 			# reset
-			not_decoded = set(range(12))
+			decoded = 0
+			num_coded = 12
+			schedule_decoding(took)
 			print("Recode")
 
+	if CHECK_ALLOCATIONS:
+		allocated = mem_free - gc.mem_free()
+		if allocated > 0:
+			print("Frame allocated", allocated, "bytes")
+
+	# prepare the next passwords when there's time left in the frame
+	if frames.remaining() > prefetch_margin:
+		next_passwords.fill()
+
 	################################################################
 	# password decoded
-	if len(not_decoded) == 0:
-		end_time = time.monotonic_ns()
-		took = (end_time - start_time) // 1000 // 1000 / 1000
+	if decoded == ALL_DECODED:
+		end_time = supervisor.ticks_ms()
+		took = ticks_diff(end_time, start_time) / 1000
 		#
 		if average_time == 0:
 			average_time = took
 		else:
 			average_time = (average_time + 3 * took) / 4
 		#
-		print("The password was:","".join(password),f"decoded in {took:.3f} s")
+		print("The password was:",password.decode(),f"decoded in {took:.3f} s")
 		print(f"Average: {average_time}s")
+		print(frames.report())
 		#
 		for x in range(4):
 			pixels.brightness = 0.01
@@ -282,25 +372,20 @@ while True:
 			pixels.brightness = 1.0
 			pixels.show()
 			time.sleep(0.25)
-		not_decoded = set(range(12))
+		decoded = 0
+		num_coded = 12
 
 		# new password
-		password = get_password()
-		chances_decoding = CHANCES_DECODING
+		next_passwords.take_into(password)
 		button_speedup = False
 
-		start_time = time.monotonic_ns()
-	else:
-		############################################################
-		
-		# adapt the chances of decoding to make it not too long
-		if ACCELERATE_WHEN_NOT_FOUND:
-			if took > TIME_DECODING:
-				chances_decoding += 0.001
+		start_time = supervisor.ticks_ms()
+		schedule_decoding(0)
+		frames.reset()
 
 	################################################################
 	# display the progression of decoding via defcon LEDs
-	dd = len(not_decoded) / 2
+	dd = num_coded / 2
 	if defcon != dd:
 		defcon = dd
 		pixels.fill(0)
@@ -308,5 +393,3 @@ while True:
 			if x >= defcon - 1:
 				pixels[x] = colors[x]
 		pixels.show()
-
-	time.sleep(SPEED_DELAY)
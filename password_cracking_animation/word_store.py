@@ -0,0 +1,284 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+Random access to the word lists made by make_dicts.py.
+- Each words/words-N.txt file is opened once and stays open.
+- A small index per size keeps the record count, the record width
+  and the offset of the first and last records.
+- Or all the words are in a single words.bin pack file.
+- Picking a word is one seek and one read.
+- The sizes are picked with alias tables, weighted by the number of
+  passwords that can be made with each size.
+- The words of a pack made with frequencies are picked with an alias
+  table in the pack, weighted by their frequency.
+"""
+import os
+import random
+import struct
+
+MAX_SIZE = 12
+MAX_WORDS = 3
+
+"""
+The pack file starts with a header:
+- magic, format version, bits per character, number of sizes,
+  length of the character set (0 for 8 bits characters).
+- the character set, the code of a character is its index.
+- for each size: size, number of words, offset of the first record,
+  offset of the alias table (0 if none), total weight of the words.
+The records are the character codes of the words, without separator,
+packed from the most significant bit and padded to a whole byte.
+Each entry of an alias table is the probability to keep the word,
+out of 65536, and the index of the word to use otherwise.
+"""
+PACK_MAGIC = b"WOPR"
+PACK_VERSION = 2
+PACK_HEADER = "<4sBBBB"
+PACK_ENTRY = "<IIIIf"
+ALIAS_ENTRY = "<HI"
+
+
+def record_size(size, bits):
+	"""Bytes used by a word of that size"""
+	return (size * bits + 7) // 8
+
+
+class AliasTable:
+	"""Pick values with their weights in constant time (Vose's alias method)"""
+
+	def __init__(self, values, weights):
+		self.values = values
+		count = len(weights)
+		total = sum(weights)
+		self.prob = [weight * count / total for weight in weights]
+		self.alias = list(range(count))
+		small = [index for index in range(count) if self.prob[index] < 1]
+		large = [index for index in range(count) if self.prob[index] >= 1]
+		while small and large:
+			less = small.pop()
+			more = large.pop()
+			self.alias[less] = more
+			self.prob[more] += self.prob[less] - 1
+			if self.prob[more] < 1:
+				small.append(more)
+			else:
+				large.append(more)
+		for index in small + large:
+			self.prob[index] = 1
+
+	def sample(self):
+		index = random.randrange(len(self.values))
+		if random.random() >= self.prob[index]:
+			index = self.alias[index]
+		return self.values[index]
+
+
+class Words:
+	"""Picking the sizes of the words, common to the word sources"""
+
+	def _index_sizes(self, weights):
+		"""
+		Make the size tables from the weight of the words of each size.
+		The weight of a size, for the space left and number of words left,
+		is the number of ways to fill that space with that size first.
+		"""
+		self.sizes = sorted(size for size in weights if weights[size] > 0)
+		self.min_size = self.sizes[0] if self.sizes else 0
+		ways = {}
+		def fill_ways(space, words_left):
+			if words_left == 0 or space < self.min_size:
+				return 1
+			if (space, words_left) not in ways:
+				ways[space, words_left] = sum(
+					weights[size] * fill_ways(space - size, words_left - 1)
+					for size in self.sizes if size <= space
+				)
+			return ways[space, words_left]
+		self.size_tables = {}
+		for space in range(self.min_size, MAX_SIZE + 1):
+			sizes = [size for size in self.sizes if size <= space]
+			if not sizes:
+				continue
+			for words_left in range(1, MAX_WORDS + 1):
+				self.size_tables[space, words_left] = AliasTable(sizes, [
+					weights[size] * fill_ways(space - size, words_left - 1)
+					for size in sizes
+				])
+
+	def __bool__(self):
+		return bool(self.sizes)
+
+	def random_size(self, space, words_left=1):
+		"""Pick the size of the next word, to fit in space"""
+		return self.size_tables[space, min(words_left, MAX_WORDS)].sample()
+
+
+class WordFile:
+	"""One open word file, all records are the same size"""
+
+	def __init__(self, filename, size):
+		self.size = size
+		# each record is the word and a new line
+		self.width = size + 1
+		self.file = open(filename, "rb")
+		try:
+			file_size = os.stat(filename)[6]
+			# the last new line might be missing
+			self.count = (file_size + 1) // self.width
+			self.first = 0
+			self.last = (self.count - 1) * self.width
+			self._validate(file_size)
+		except Exception:
+			self.file.close()
+			raise
+
+	def _validate(self, file_size):
+		"""Check that the file is made of fixed size records"""
+		if self.count <= 0 or file_size not in (
+			self.count * self.width, self.count * self.width - 1
+		):
+			raise ValueError(f"Invalid size {file_size} for words of {self.size}")
+		for offset in (self.first, self.last):
+			self.file.seek(offset)
+			record = self.file.read(self.width)
+			if record.find(b"\n") not in (-1, self.size):
+				raise ValueError(f"Invalid record at {offset} for words of {self.size}")
+
+	def word(self, index):
+		"""Read the word at that index"""
+		self.file.seek(self.first + index * self.width)
+		return self.file.read(self.size).decode()
+
+	def random_word(self):
+		return self.word(random.randrange(self.count))
+
+	def close(self):
+		self.file.close()
+
+
+class WordPack(Words):
+	"""All the words in one pack file, by size"""
+
+	def __init__(self, filename):
+		self.file = open(filename, "rb")
+		try:
+			self._read_header()
+		except Exception:
+			self.file.close()
+			raise
+
+	def _read_header(self):
+		header = self.file.read(struct.calcsize(PACK_HEADER))
+		magic, version, bits, num_sizes, charset_len = struct.unpack(PACK_HEADER, header)
+		if magic != PACK_MAGIC or version != PACK_VERSION:
+			raise ValueError("Not a supported words pack")
+		self.bits = bits
+		self.charset = self.file.read(charset_len)
+		entry_size = struct.calcsize(PACK_ENTRY)
+		self.entries = {}
+		weights = {}
+		for index in range(num_sizes):
+			size, count, offset, table_offset, weight = struct.unpack(
+				PACK_ENTRY, self.file.read(entry_size)
+			)
+			if count == 0:
+				continue
+			# preallocated buffers for the record and the word
+			self.entries[size] = (
+				count, offset, record_size(size, bits),
+				bytearray(record_size(size, bits)), bytearray(size),
+				table_offset,
+			)
+			weights[size] = weight
+		self._alias = bytearray(struct.calcsize(ALIAS_ENTRY))
+		self._index_sizes(weights)
+
+	def count(self, size):
+		"""Number of words of that size"""
+		if size in self.entries:
+			return self.entries[size][0]
+		return 0
+
+	def word(self, size, index):
+		"""Read and unpack the word of that size at that index"""
+		count, offset, rec_size, record, word, table_offset = self.entries[size]
+		self.file.seek(offset + index * rec_size)
+		self.file.readinto(record)
+		if self.bits == 8:
+			return str(record, "ascii")
+		bits = self.bits
+		mask = (1 << bits) - 1
+		charset = self.charset
+		value = 0
+		num_bits = 0
+		position = 0
+		for byte in record:
+			value = (value << 8) | byte
+			num_bits += 8
+			while num_bits >= bits and position < size:
+				num_bits -= bits
+				word[position] = charset[(value >> num_bits) & mask]
+				position += 1
+			value &= (1 << num_bits) - 1
+		return str(word, "ascii")
+
+	def random_word(self, size):
+		"""Pick a random word of that size, with its frequency if any"""
+		entry = self.entries[size]
+		index = random.randrange(entry[0])
+		table_offset = entry[5]
+		if table_offset:
+			self.file.seek(table_offset + index * len(self._alias))
+			self.file.readinto(self._alias)
+			prob, alias = struct.unpack_from(ALIAS_ENTRY, self._alias)
+			if random.getrandbits(16) >= prob:
+				index = alias
+		return self.word(size, index)
+
+	def close(self):
+		self.file.close()
+		self.entries = {}
+		self._index_sizes({})
+
+
+class WordStore(Words):
+	"""All the word files of a words directory, by size"""
+
+	def __init__(self, directory="words", max_size=MAX_SIZE):
+		self.files = {}
+		for size in range(1, max_size + 1):
+			filename = f"{directory}/words-{size}.txt"
+			try:
+				self.files[size] = WordFile(filename, size)
+			except OSError:
+				pass
+			except ValueError as err:
+				print(err)
+		self._index_sizes({size: self.files[size].count for size in self.files})
+
+	def count(self, size):
+		"""Number of words of that size"""
+		if size in self.files:
+			return self.files[size].count
+		return 0
+
+	def random_word(self, size):
+		"""Pick a random word of that size"""
+		return self.files[size].random_word()
+
+	def close(self):
+		for word_file in self.files.values():
+			word_file.close()
+		self.files = {}
+		self._index_sizes({})
+
+
+def open_words(directory="words"):
+	"""The words pack if there is one, or the words directory"""
+	try:
+		return WordPack(directory + ".bin")
+	except OSError:
+		pass
+	except ValueError as err:
+		print(err)
+	return WordStore(directory)
@@ -0,0 +1,137 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+Estimate the drift of the board's clock between NTP syncs.
+- The time is modeled as monotonic + offset + drift * (time since sync).
+- At each sync the error of the prediction updates the drift, and the
+  uncertainty of the drift, which moves a part of the way at each sync: a
+  single sync doesn't push the next ones away, or bring them closer.
+- The offset of a sample can be off by half its round trip. When that
+  error, over the time between the syncs, is more than the uncertainty
+  (like a sync after a few minutes), the drift is not measured. Otherwise
+  the closer it is to the uncertainty, the less the measure counts.
+- The next sync is when the uncertainty could exceed the error budget,
+  between a minimum and a maximum delay.
+- Between syncs, the RTC is set again from the model when the drift has
+  moved it by more than half a second.
+- The drift and its uncertainty are saved in the NVM, they are a property
+  of the board's crystal.
+"""
+import struct
+import time
+
+NVM_FORMAT = "<4sff"
+NVM_MAGIC = b"DRFT"
+NVM_SIZE = struct.calcsize(NVM_FORMAT)
+"""Where the drift is saved in the NVM."""
+NVM_OFFSET = 0
+"""Drift of a typical crystal, assumed until it's measured."""
+DEFAULT_UNCERTAINTY = 50e-6
+"""Time between syncs too short to measure the drift, in seconds."""
+MIN_MEASURE_TIME = 10 * 60
+"""Error of the RTC that is corrected between syncs, in seconds."""
+CORRECTION_STEP = 0.5
+"""Weight of a new measure in the drift, after the first one."""
+DRIFT_GAIN = 0.5
+"""Weight of a new measure in the uncertainty."""
+UNCERTAINTY_GAIN = 0.25
+"""Lowest uncertainty, the drift of a crystal moves with the temperature."""
+MIN_UNCERTAINTY = 5e-6
+
+
+class ClockDrift:
+	"""The time of the last sync, corrected by the drift of the clock"""
+
+	def __init__(self, nvm=None, budget=0.5, min_delay=30 * 60, max_delay=24 * 60 * 60):
+		self.nvm = nvm
+		self.budget = budget
+		self.min_delay = min_delay
+		self.max_delay = max_delay
+		# fraction of time gained by the real time over monotonic
+		self.drift = 0.0
+		self.uncertainty = DEFAULT_UNCERTAINTY
+		self.measured = False
+		# last sync: monotonic_ns, the offset to unix time and the round trip in ns
+		self.sync_mono = None
+		self.sync_offset = 0
+		self.sync_round_trip = 0
+		# when the RTC was set, in monotonic_ns
+		self.rtc_mono = None
+		self.load()
+
+	def load(self):
+		if self.nvm is None:
+			return
+		# the NVM can only be sliced, it doesn't share its buffer
+		data = bytes(self.nvm[NVM_OFFSET:NVM_OFFSET + NVM_SIZE])
+		magic, drift, uncertainty = struct.unpack(NVM_FORMAT, data)
+		if magic == NVM_MAGIC:
+			self.drift = drift
+			self.uncertainty = max(uncertainty, MIN_UNCERTAINTY)
+			self.measured = True
+
+	def save(self):
+		if self.nvm is None:
+			return
+		data = struct.pack(NVM_FORMAT, NVM_MAGIC, self.drift, self.uncertainty)
+		if self.nvm[NVM_OFFSET:NVM_OFFSET + NVM_SIZE] != data:
+			self.nvm[NVM_OFFSET:NVM_OFFSET + NVM_SIZE] = data
+
+	def time_ns(self):
+		"""Unix time in ns now according to the model"""
+		now = time.monotonic_ns()
+		if self.sync_mono is None:
+			raise RuntimeError("The clock was never synced")
+		return now + self.sync_offset + int(self.drift * (now - self.sync_mono))
+
+	def sync(self, sample):
+		"""
+		Add a NTP sample (with an offset from monotonic_ns in ns),
+		returns the error of the prediction in seconds, or None.
+		"""
+		now = time.monotonic_ns()
+		error = None
+		if self.sync_mono is not None:
+			elapsed = now - self.sync_mono
+			predicted = self.sync_offset + int(self.drift * elapsed)
+			error = (sample.offset - predicted) / 1_000_000_000
+			# both offsets can be off by half their round trip
+			noise = (self.sync_round_trip + sample.delay) / 2 / elapsed
+			if elapsed >= MIN_MEASURE_TIME * 1_000_000_000 and noise <= self.uncertainty:
+				measure = error / (elapsed / 1_000_000_000)
+				confidence = self.uncertainty ** 2 / (self.uncertainty ** 2 + noise ** 2)
+				if self.measured:
+					self.drift += DRIFT_GAIN * confidence * measure
+				else:
+					self.drift += confidence * measure
+				self.uncertainty += UNCERTAINTY_GAIN * confidence * (abs(measure) - self.uncertainty)
+				self.uncertainty = max(self.uncertainty, MIN_UNCERTAINTY)
+				self.measured = True
+				self.save()
+		self.sync_mono = now
+		self.sync_offset = sample.offset
+		self.sync_round_trip = sample.delay
+		return error
+
+	def rtc_was_set(self):
+		self.rtc_mono = time.monotonic_ns()
+
+	def correction_due(self):
+		"""If the drift moved the RTC enough since it was set"""
+		if self.sync_mono is None or self.rtc_mono is None:
+			return False
+		elapsed = time.monotonic_ns() - self.rtc_mono
+		return abs(self.drift * elapsed) >= CORRECTION_STEP * 1_000_000_000
+
+	def sync_delay(self):
+		"""Seconds until the error could exceed the budget"""
+		if self.uncertainty <= 0:
+			return self.max_delay
+		delay = self.budget / self.uncertainty
+		return min(max(delay, self.min_delay), self.max_delay)
+
+	def report(self):
+		return (
+			f"Drift: {self.drift * 1e6:+.2f} ppm"
+			f" (+/- {self.uncertainty * 1e6:.2f}) next sync in {self.sync_delay():.0f} s"
+		)
@@ -0,0 +1,91 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+Draw the clock on the 12 characters display only when it changes.
+- The text changes when the second changes, and the separators are on
+  for the first half of each second: 2 redraws per second.
+- The day and date prefix is computed with localtime() once a day, the
+  time of day is computed from the seconds since midnight.
+"""
+import time
+
+# the separators are the dots of the 8th and 10th digits
+TIME_DOTS = (1 << 7) | (1 << 9)
+# characters of the day and date prefix, like "JEU 1 "
+PREFIX_SIZE = 6
+SECONDS_PER_DAY = 24 * 60 * 60
+ZERO = ord("0")
+
+
+class ClockRenderer:
+	"""Render the time of the RTC on the display, as "DAY DD HHMMSS" """
+
+	def __init__(self, display, week_days, blink=0.5):
+		self.display = display
+		self.week_days = [day.upper() for day in week_days]
+		self.blink = int(blink * 1_000_000_000)
+		self.frame = bytearray(b" " * 12)
+		# local time in seconds of the last midnight and the next one
+		self.midnight = 0
+		self.next_midnight = 0
+		# what is shown
+		self.seconds = None
+		self.separator = False
+		self.second_start = 0
+		self.hour = 0
+		self.minute = 0
+		self.second = 0
+		self.redraws = 0
+
+	def invalidate(self):
+		"""Something else was shown, redraw on the next update"""
+		self.seconds = None
+
+	def update(self, now_ns, draw=True):
+		"""
+		Redraw if the text changed, now_ns is time.monotonic_ns().
+		With draw False, only follow the time, when something else is shown.
+		"""
+		seconds = time.time()
+		if seconds != self.seconds:
+			self.seconds = seconds
+			self.second_start = now_ns
+			self.separator = True
+			self._set_time(seconds)
+		elif self.separator and now_ns - self.second_start >= self.blink:
+			self.separator = False
+		else:
+			return False
+		if not draw:
+			return True
+		if self.separator:
+			self.display.render(self.frame, TIME_DOTS)
+		else:
+			self.display.render(self.frame)
+		self.display.show()
+		self.redraws += 1
+		return True
+
+	def _set_prefix(self, seconds):
+		"""The day and date, and the limits of the day"""
+		now = time.localtime(seconds)
+		day = self.week_days[now.tm_wday]
+		self.frame[0:PREFIX_SIZE] = f"{day}{now.tm_mday:2d} ".encode()
+		self.midnight = seconds - (now.tm_hour * 3600 + now.tm_min * 60 + now.tm_sec)
+		self.next_midnight = self.midnight + SECONDS_PER_DAY
+
+	def _set_time(self, seconds):
+		# the RTC can also be set backwards by NTP
+		if not self.midnight <= seconds < self.next_midnight:
+			self._set_prefix(seconds)
+		of_day = seconds - self.midnight
+		self.hour = of_day // 3600
+		self.minute = of_day // 60 % 60
+		self.second = of_day % 60
+		frame = self.frame
+		frame[6] = ZERO + self.hour // 10
+		frame[7] = ZERO + self.hour % 10
+		frame[8] = ZERO + self.minute // 10
+		frame[9] = ZERO + self.minute % 10
+		frame[10] = ZERO + self.second // 10
+		frame[11] = ZERO + self.second % 10
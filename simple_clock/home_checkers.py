@@ -1,30 +1,169 @@
+"""
+Home checks, registered with the @check decorator.
+- Each check has a name, an interval between runs, a timeout and can be
+  disabled. It's called with the requests session and its timeout, and
+  returns (ok, message).
+- A check can instead declare a url and a JSON path like "[0].date", it's
+  then called with the value at that path, read from the response as it
+  arrives without parsing the whole document.
+- With a cache (an HTTPCache), those requests are conditional, and the
+  value of the last response is used again if the server answers 304.
+- do_checks_async() runs the checks that are due, from an asyncio task,
+  one after the other, and the other tasks run between two checks. But the
+  requests of adafruit_requests block: while a check runs, up to its
+  timeout, the board does nothing else and the clock is not updated.
+- A check that fails or times out returns a message instead of stopping
+  the others.
+- The checks start START_DELAY after the boot. If they could not run at all
+  (no network), retry_later() sets them RETRY_DELAY later, so that the
+  next time of the checks is never in the past.
+"""
+import asyncio
+import time
 from adafruit_datetime import datetime
 from adafruit_datetime import timedelta
 from secrets import secrets
 
+from json_stream import find_path
+
 NET_TEST = secrets["NET_TEST"]
-requests = None
+DEFAULT_INTERVAL = 2 * 60 * 60 # 2h
+DEFAULT_TIMEOUT = 10
+START_DELAY = 1 * 60 # wait 1 minute before the first checks
+RETRY_DELAY = 10 * 60 # after the checks could not run
+# bytes read at a time from the responses
+CHUNK_SIZE = 64
+HTTP_NOT_MODIFIED = 304
+
+"""The HTTPCache of the requests of the checks, set by the program."""
+cache = None
+
+CHECKS = []
+
+
+class Check:
+	def __init__(self, name, function, interval, timeout, enabled, url, path):
+		self.name = name
+		self.function = function
+		self.interval = interval
+		self.timeout = timeout
+		self.enabled = enabled
+		self.url = url
+		self.path = path
+		# time.monotonic() of the next run, and before which it can't run early
+		self.next_time = time.monotonic() + START_DELAY
+		self.not_before = self.next_time
+
+	def run(self, requests):
+		"""Call the function, with the value at the path if there's one"""
+		if self.path is None:
+			return self.function(requests, self.timeout)
+		key = self.url + " " + self.path
+		headers = {}
+		if cache is not None:
+			headers = cache.headers(key)
+		with requests.get(self.url, headers=headers, timeout=self.timeout) as response:
+			if response.status_code == HTTP_NOT_MODIFIED and cache is not None and key in cache:
+				value = cache.value(key)
+			else:
+				value = find_path(response.iter_content(chunk_size=CHUNK_SIZE), self.path)
+				if cache is not None:
+					cache.store(key, response.headers, value)
+		return self.function(value)
+
+	def is_due(self, now, early=0):
+		"""If it's time, or the early part of the interval is over"""
+		return self.enabled and now >= self.not_before and (
+			now >= self.next_time - self.interval * early
+		)
+
+	def retry(self, delay):
+		"""It could not run, try again after delay (or the interval)"""
+		self.next_time = time.monotonic() + min(delay, self.interval)
+		self.not_before = self.next_time
+
+	def result(self, ok, message):
+		self.next_time = time.monotonic() + self.interval
+		return (ok, self.name, message)
+
+
+def check(name, interval=DEFAULT_INTERVAL, timeout=DEFAULT_TIMEOUT, enabled=True,
+		url=None, path=None):
+	"""Register a check function"""
+	def register(function):
+		CHECKS.append(Check(name, function, interval, timeout, enabled, url, path))
+		return function
+	return register
+
+
+####################################################################
+# checks
+####################################################################
 
-def check_nettest():
+@check("nettest", url=NET_TEST, path="[0].date")
+def check_nettest(timing):
 	ref_delta = timedelta(days=1)
-	with requests.get(NET_TEST) as response:
-		data = response.json()
-		timing = data[0]["date"]
-		last_time = datetime.fromisoformat(timing)
-		delta = datetime.now() - last_time
-		if delta > ref_delta:
-			return (False, "nettest", "CHECK RASPI TWO")
-	return (True, "nettest", "OK")
-
-def check_demo():
-	return (False, "demo", "CHECK RASPI DEMO")
-
-def do_checks(reqs):
-	global requests
-	requests = reqs
-	if requests:
-		return [
-			check_nettest(),
-			# check_demo(),
-		]
-	return []
+	last_time = datetime.fromisoformat(timing)
+	delta = datetime.now() - last_time
+	if delta > ref_delta:
+		return (False, "CHECK RASPI TWO")
+	return (True, "OK")
+
+@check("demo", enabled=False)
+def check_demo(requests, timeout):
+	return (False, "CHECK RASPI DEMO")
+
+####################################################################
+# run the checks
+####################################################################
+
+def due_checks(early=0):
+	now = time.monotonic()
+	return [item for item in CHECKS if item.is_due(now, early)]
+
+
+def retry_later(early=0, delay=RETRY_DELAY):
+	"""The due checks could not run, like when the network failed"""
+	for item in due_checks(early):
+		item.retry(delay)
+
+
+def make_due():
+	"""Make all the enabled checks due now, when asked for"""
+	now = time.monotonic()
+	for item in CHECKS:
+		item.next_time = now
+		item.not_before = now
+
+
+def next_time():
+	"""time.monotonic() when the next check is due"""
+	times = [item.next_time for item in CHECKS if item.enabled]
+	if times:
+		return min(times)
+	return time.monotonic() + DEFAULT_INTERVAL
+
+
+def run_check(item, requests):
+	"""Run a check, without letting its errors out"""
+	try:
+		ok, message = item.run(requests)
+	except Exception as error:
+		print("Check", item.name, "failed:", repr(error))
+		return item.result(False, item.name.upper() + " FAILED")
+	return item.result(ok, message)
+
+
+async def do_checks_async(requests, early=0):
+	"""
+	Run the checks that are due, or which early part of the interval is over,
+	return a list of (ok, name, message).
+	"""
+	if not requests:
+		return []
+	results = []
+	for item in due_checks(early):
+		# update the clock before the request blocks
+		await asyncio.sleep(0)
+		results.append(run_check(item, requests))
+	return results
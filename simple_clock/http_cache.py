@@ -0,0 +1,114 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+Cache of the results of GET requests, with their validators.
+- Keeps the ETag and Last-Modified of the response with the value read
+  from it, and gives the If-None-Match and If-Modified-Since headers.
+- On a 304 Not Modified, the cached value is used.
+- Saved as JSON in the NVM (or a file), only when the validators change,
+  to keep it over reloads without wearing the flash.
+"""
+import json
+import struct
+
+NVM_MAGIC = b"HTC1"
+NVM_HEADER = "<4sH"
+NVM_HEADER_SIZE = struct.calcsize(NVM_HEADER)
+"""Where the cache is saved in the NVM, after the clock drift."""
+NVM_OFFSET = 256
+NVM_SIZE = 1024
+
+
+def get_header(headers, name):
+	"""A header of the response, whatever its case"""
+	name = name.lower()
+	for key, value in headers.items():
+		if key.lower() == name:
+			return value
+	return None
+
+
+class HTTPCache:
+	"""Validators and values by key (like the url and the path)"""
+
+	def __init__(self, nvm=None, offset=NVM_OFFSET, size=NVM_SIZE, filename=None):
+		self.nvm = nvm
+		self.offset = offset
+		self.size = size
+		self.filename = filename
+		# key: [etag, last_modified, value]
+		self.entries = {}
+		self.hits = 0
+		self.misses = 0
+		self.load()
+
+	def load(self):
+		data = None
+		if self.nvm is not None:
+			# the NVM can only be sliced, it doesn't share its buffer
+			header = bytes(self.nvm[self.offset:self.offset + NVM_HEADER_SIZE])
+			magic, length = struct.unpack(NVM_HEADER, header)
+			if magic == NVM_MAGIC and length <= self.size - NVM_HEADER_SIZE:
+				start = self.offset + NVM_HEADER_SIZE
+				data = bytes(self.nvm[start:start + length])
+		elif self.filename is not None:
+			try:
+				with open(self.filename, "rb") as fp:
+					data = fp.read()
+			except OSError:
+				pass
+		if data:
+			try:
+				self.entries = json.loads(data)
+			except ValueError:
+				self.entries = {}
+
+	def save(self):
+		data = json.dumps(self.entries).encode()
+		if self.nvm is not None:
+			if len(data) > self.size - NVM_HEADER_SIZE:
+				print("HTTP cache too big for the NVM:", len(data))
+				return
+			header = struct.pack(NVM_HEADER, NVM_MAGIC, len(data))
+			self.nvm[self.offset:self.offset + NVM_HEADER_SIZE + len(data)] = header + data
+		elif self.filename is not None:
+			try:
+				with open(self.filename, "wb") as fp:
+					fp.write(data)
+			except OSError:
+				# the drive is read only for the code
+				pass
+
+	def headers(self, key):
+		"""The headers of a conditional request"""
+		headers = {}
+		entry = self.entries.get(key)
+		if entry is not None:
+			etag, last_modified, _ = entry
+			if etag:
+				headers["If-None-Match"] = etag
+			if last_modified:
+				headers["If-Modified-Since"] = last_modified
+		return headers
+
+	def value(self, key):
+		"""The cached value after a 304"""
+		self.hits += 1
+		return self.entries[key][2]
+
+	def store(self, key, response_headers, value):
+		"""Keep the value and the validators of a 200 response"""
+		self.misses += 1
+		etag = get_header(response_headers, "ETag")
+		last_modified = get_header(response_headers, "Last-Modified")
+		if not etag and not last_modified:
+			if self.entries.pop(key, None) is not None:
+				self.save()
+			return
+		entry = [etag, last_modified, value]
+		if self.entries.get(key) != entry:
+			self.entries[key] = entry
+			self.save()
+
+	def __contains__(self, key):
+		return key in self.entries
@@ -0,0 +1,253 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+Find one value in a JSON document read by chunks, without parsing it all.
+- The path is like "[0].date" or "results[2].name".
+- The values before the one we want are skipped byte by byte, only the
+  keys of the objects on the path are decoded.
+- Stops reading as soon as the value is read, the memory used is the size
+  of a chunk and of the value.
+- The characters outside of the BMP, escaped as a pair of surrogates
+  (like emoji), are decoded, a lone surrogate becomes U+FFFD.
+
+	value = find_path(response.iter_content(chunk_size=64), "[0].date")
+"""
+import json
+
+QUOTE = ord('"')
+BACKSLASH = ord("\\")
+COLON = ord(":")
+COMMA = ord(",")
+OPEN_OBJECT = ord("{")
+CLOSE_OBJECT = ord("}")
+OPEN_ARRAY = ord("[")
+CLOSE_ARRAY = ord("]")
+WHITESPACE = b" \t\r\n"
+# the characters that end a number or a literal
+DELIMITERS = b" \t\r\n,]}"
+ESCAPES = {
+	ord('"'): '"', ord("\\"): "\\", ord("/"): "/", ord("b"): "\b",
+	ord("f"): "\f", ord("n"): "\n", ord("r"): "\r", ord("t"): "\t",
+}
+# the character of the surrogates that are not in a pair
+REPLACEMENT = "\ufffd".encode()
+
+
+def parse_path(path):
+	"""Split "[0].date" into [0, "date"]"""
+	keys = []
+	for part in path.replace("[", ".[").split("."):
+		if not part:
+			continue
+		if part[0] == "[":
+			if part[-1] != "]":
+				raise ValueError("Invalid path: " + path)
+			keys.append(int(part[1:-1]))
+		else:
+			keys.append(part)
+	return keys
+
+
+class _Reader:
+	"""The bytes of the chunks, one at a time"""
+
+	def __init__(self, chunks):
+		self.chunks = iter(chunks)
+		self.buffer = b""
+		self.index = 0
+		self.size = 0
+
+	def peek(self):
+		while self.index >= len(self.buffer):
+			chunk = next(self.chunks, None)
+			if chunk is None:
+				raise ValueError("Unexpected end of the JSON document")
+			if isinstance(chunk, str):
+				chunk = chunk.encode()
+			self.buffer = chunk
+			self.index = 0
+			self.size += len(chunk)
+		return self.buffer[self.index]
+
+	def next(self):
+		byte = self.peek()
+		self.index += 1
+		return byte
+
+	def skip_whitespace(self):
+		while self.peek() in WHITESPACE:
+			self.index += 1
+
+	def next_token(self):
+		"""The next byte that is not whitespace"""
+		byte = self.next()
+		while byte in WHITESPACE:
+			byte = self.next()
+		return byte
+
+	def expect(self, expected):
+		byte = self.next_token()
+		if byte != expected:
+			raise ValueError(f"Expected {chr(expected)!r} got {chr(byte)!r}")
+
+
+class JSONPathScanner:
+	"""Scan a JSON document from chunks of bytes for the value at a path"""
+
+	def __init__(self, chunks):
+		self.reader = _Reader(chunks)
+
+	@property
+	def bytes_read(self):
+		return self.reader.size
+
+	def find(self, path):
+		"""The value at the path, raises KeyError or IndexError if it's not there"""
+		reader = self.reader
+		for key in parse_path(path):
+			if isinstance(key, int):
+				self._enter_array(key)
+			else:
+				self._enter_object(key)
+		return self._read_value(reader.next_token())
+
+	def _enter_array(self, position):
+		reader = self.reader
+		reader.expect(OPEN_ARRAY)
+		reader.skip_whitespace()
+		if reader.peek() == CLOSE_ARRAY:
+			raise IndexError(position)
+		for _ in range(position):
+			self._skip_value(reader.next_token())
+			if reader.next_token() != COMMA:
+				raise IndexError(position)
+
+	def _enter_object(self, key):
+		reader = self.reader
+		reader.expect(OPEN_OBJECT)
+		while True:
+			byte = reader.next_token()
+			if byte == CLOSE_OBJECT:
+				raise KeyError(key)
+			if byte != QUOTE:
+				raise ValueError("Expected a key")
+			name = self._read_string()
+			reader.expect(COLON)
+			if name == key:
+				return
+			self._skip_value(reader.next_token())
+			if reader.next_token() != COMMA:
+				raise KeyError(key)
+
+	def _read_string(self):
+		"""The string after the opening quote"""
+		reader = self.reader
+		out = bytearray()
+		while True:
+			byte = reader.next()
+			if byte == QUOTE:
+				return out.decode()
+			if byte == BACKSLASH:
+				self._read_escape(out)
+			else:
+				out.append(byte)
+
+	def _read_hex(self):
+		"""The code of a \\u escape, after the u"""
+		return int(bytes(self.reader.next() for _ in range(4)), 16)
+
+	def _read_escape(self, out):
+		"""Add the character of the escape after the backslash to out"""
+		reader = self.reader
+		byte = reader.next()
+		if byte != ord("u"):
+			out.extend(ESCAPES[byte].encode())
+			return
+		code = self._read_hex()
+		while 0xD800 <= code < 0xDC00:
+			# a high surrogate, the low one must be the next escape
+			if reader.peek() != BACKSLASH:
+				break
+			reader.next()
+			byte = reader.next()
+			if byte != ord("u"):
+				out.extend(REPLACEMENT)
+				out.extend(ESCAPES[byte].encode())
+				return
+			low = self._read_hex()
+			if 0xDC00 <= low < 0xE000:
+				code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+				break
+			# maybe the high surrogate of the next pair
+			out.extend(REPLACEMENT)
+			code = low
+		if 0xD800 <= code < 0xE000:
+			out.extend(REPLACEMENT)
+		else:
+			out.extend(chr(code).encode())
+
+	def _skip_string(self):
+		reader = self.reader
+		while True:
+			byte = reader.next()
+			if byte == QUOTE:
+				return
+			if byte == BACKSLASH:
+				reader.next()
+
+	def _skip_value(self, byte):
+		"""Skip the value that starts with byte"""
+		reader = self.reader
+		if byte == QUOTE:
+			self._skip_string()
+		elif byte == OPEN_OBJECT or byte == OPEN_ARRAY:
+			depth = 1
+			while depth:
+				byte = reader.next()
+				if byte == QUOTE:
+					self._skip_string()
+				elif byte == OPEN_OBJECT or byte == OPEN_ARRAY:
+					depth += 1
+				elif byte == CLOSE_OBJECT or byte == CLOSE_ARRAY:
+					depth -= 1
+		else:
+			while reader.peek() not in DELIMITERS:
+				reader.next()
+
+	def _read_value(self, byte):
+		"""Read the value that starts with byte"""
+		reader = self.reader
+		if byte == QUOTE:
+			return self._read_string()
+		out = bytearray([byte])
+		if byte == OPEN_OBJECT or byte == OPEN_ARRAY:
+			# keep the text of the container and parse it
+			depth = 1
+			while depth:
+				byte = reader.next()
+				out.append(byte)
+				if byte == QUOTE:
+					while True:
+						byte = reader.next()
+						out.append(byte)
+						if byte == BACKSLASH:
+							out.append(reader.next())
+						elif byte == QUOTE:
+							break
+				elif byte == OPEN_OBJECT or byte == OPEN_ARRAY:
+					depth += 1
+				elif byte == CLOSE_OBJECT or byte == CLOSE_ARRAY:
+					depth -= 1
+		else:
+			# a number or a literal, maybe at the end of the document
+			try:
+				while reader.peek() not in DELIMITERS:
+					out.append(reader.next())
+			except ValueError:
+				pass
+		return json.loads(out.decode())
+
+
+def find_path(chunks, path):
+	"""The value at the path in the JSON document made of the chunks"""
+	return JSONPathScanner(chunks).find(path)
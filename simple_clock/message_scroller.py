@@ -0,0 +1,63 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+Scroll messages on the display one step per frame of the main loop.
+- The messages are queued, each one enters from the right like the
+  marquee of the library, then stays for a moment.
+- update() is called every frame and returns quickly, so that the loop
+  keeps reading the buttons and updating the pixels.
+"""
+
+
+class MessageScroller:
+	"""A queue of messages scrolled on a display"""
+
+	def __init__(self, display, delay=0.1, hold=1.0, width=12):
+		self.display = display
+		self.delay = int(delay * 1_000_000_000)
+		self.hold = int(hold * 1_000_000_000)
+		self.width = width
+		self.queue = []
+		# the message with spaces before it
+		self._text = None
+		self._position = 0
+		self._next_step = 0
+
+	@property
+	def active(self):
+		"""If a message is shown or waiting"""
+		return self._text is not None or len(self.queue) > 0
+
+	def add(self, message):
+		self.queue.append(message)
+
+	def clear(self):
+		"""Stop the message and forget the others"""
+		self.queue.clear()
+		self._text = None
+
+	def update(self, now_ns):
+		"""Scroll the message if it's time, return if it used the display"""
+		if self._text is None:
+			if not self.queue:
+				return False
+			message = self.queue.pop(0)
+			self._text = memoryview(b" " * self.width + message.encode())
+			self._position = 0
+			self._next_step = now_ns
+		# up to half a step early, the frames don't start exactly on time
+		if now_ns < self._next_step - self.delay // 2:
+			return True
+		if self._position < len(self._text) - self.width:
+			self._position += 1
+			position = self._position
+			self.display.render(self._text[position:position + self.width])
+			self.display.show()
+			if position == len(self._text) - self.width:
+				self._next_step += self.hold
+			else:
+				self._next_step += self.delay
+			return True
+		# the message stayed long enough, the display is free again
+		self._text = None
+		return True
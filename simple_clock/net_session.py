@@ -0,0 +1,119 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+The network of a connect window, shared by the tasks that need it.
+- Used as a context manager around the tasks: the radio is connected by
+  the first task that needs it, and turned off at the end of the window.
+- The socket pool and the SSL context are kept for the life of the program,
+  the requests session for the window, so that its sockets are reused by
+  the tasks but not kept over a radio off.
+- If the connection failed, the other tasks of the window don't try again.
+- Remembers the BSSID and channel of the access point, and connects to it
+  directly next time, without a scan. Falls back to a scan if that fails.
+"""
+import ssl
+import socketpool
+import time
+import wifi
+
+import adafruit_requests
+
+
+class NetworkSession:
+	"""Connect once per window, turn off the radio after"""
+
+	def __init__(self, ssid, password, log=print):
+		self.ssid = ssid
+		self.password = password
+		self.log = log
+		self._pool = None
+		self._ssl_context = None
+		self._requests = None
+		self._error = None
+		self._depth = 0
+		# the access point of the last connection
+		self.bssid = None
+		self.channel = 0
+		self.connections = 0
+		self.directed = 0
+		# duration of the last connection in seconds
+		self.connect_time = 0
+
+	@property
+	def connected(self):
+		return wifi.radio.enabled and wifi.radio.ipv4_address is not None
+
+	def connect(self):
+		"""Connect if not connected, raise the error of the window if it failed"""
+		if self._error is not None:
+			raise self._error
+		if self.connected:
+			return
+		start = time.monotonic_ns()
+		wifi.radio.enabled = True
+		directed = False
+		if self.bssid is not None:
+			self.log("Connecting to wifi on channel", self.channel)
+			try:
+				wifi.radio.connect(
+					ssid=self.ssid, password=self.password,
+					channel=self.channel, bssid=self.bssid,
+				)
+				directed = True
+			except Exception as error:
+				# the access point changed, forget it
+				self.log("Direct connection failed:", error)
+				self.bssid = None
+		if not directed:
+			self.log("Connecting to wifi")
+			try:
+				wifi.radio.connect(ssid=self.ssid, password=self.password)
+			except Exception as error:
+				self._error = error
+				raise
+		self.connect_time = (time.monotonic_ns() - start) / 1_000_000_000
+		self.connections += 1
+		if directed:
+			self.directed += 1
+		ap_info = wifi.radio.ap_info
+		if ap_info is not None:
+			self.bssid = bytes(ap_info.bssid)
+			self.channel = ap_info.channel
+		self.log(
+			"Connected with IP ", wifi.radio.ipv4_address,
+			f"in {self.connect_time:.2f} s" + (" (direct)" if directed else ""),
+		)
+
+	@property
+	def pool(self):
+		"""The socket pool, connected"""
+		self.connect()
+		if self._pool is None:
+			self._pool = socketpool.SocketPool(wifi.radio)
+		return self._pool
+
+	@property
+	def requests(self):
+		"""The requests session of the window, connected"""
+		if self._requests is None:
+			pool = self.pool
+			if self._ssl_context is None:
+				self._ssl_context = ssl.create_default_context()
+			self._requests = adafruit_requests.Session(pool, self._ssl_context)
+		return self._requests
+
+	def close(self):
+		"""End the window, turn off the radio"""
+		self.log("Turn off Wifi")
+		self._requests = None
+		self._error = None
+		wifi.radio.enabled = False
+
+	def __enter__(self):
+		self._depth += 1
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self._depth -= 1
+		if self._depth == 0:
+			self.close()
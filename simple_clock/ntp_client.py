@@ -0,0 +1,158 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+SNTP client that keeps the best of several samples.
+- Queries each server one or more times, a server that doesn't answer is
+  not asked again.
+- Uses the 4 timestamps: send and receive on time.monotonic_ns(), receive
+  and transmit of the server with their fraction, to get the offset of the
+  server's time from monotonic, and the round trip delay.
+- Rejects the replies that don't answer our request (originate timestamp),
+  and the servers that are not synchronized.
+- Keeps the sample with the lowest delay, the most accurate.
+- The server name is resolved before the send time is taken, the DNS
+  lookup doesn't count in the round trip.
+- sync_async() runs in an asyncio task, with a non blocking socket: the
+  other tasks run while waiting for the replies.
+Works with a socketpool.SocketPool or the socket module of CPython.
+"""
+import errno
+import struct
+import time
+
+try:
+	import asyncio
+except ImportError:
+	asyncio = None
+
+NTP_PORT = 123
+# seconds from 1900-01-01 to 1970-01-01
+NTP_TO_UNIX = 2_208_988_800
+PACKET_SIZE = 48
+# no leap second warning, version 4, client mode
+CLIENT_HEADER = 0b00100011
+# leap indicator "clock not synchronized"
+LEAP_UNSYNCHRONIZED = 3
+MODE_SERVER = 4
+# seconds between two reads of a non blocking socket
+POLL_DELAY = 0.005
+
+
+def to_ns(seconds, fraction):
+	"""NTP timestamp to unix time in ns"""
+	return (seconds - NTP_TO_UNIX) * 1_000_000_000 + (fraction * 1_000_000_000 >> 32)
+
+
+class NTPSample:
+	"""The time of a server as an offset from time.monotonic_ns()"""
+
+	def __init__(self, server, offset, delay, stratum):
+		self.server = server
+		self.offset = offset
+		self.delay = delay
+		self.stratum = stratum
+
+	def time_ns(self):
+		"""Unix time in ns now"""
+		return time.monotonic_ns() + self.offset
+
+	def __repr__(self):
+		return (
+			f"<NTPSample {self.server} delay: {self.delay / 1_000_000:.1f} ms"
+			f" stratum: {self.stratum}>"
+		)
+
+
+class NTPClient:
+	"""Query NTP servers and keep the sample with the lowest delay"""
+
+	def __init__(self, pool, servers=("pool.ntp.org",), samples=1, timeout=1.0, port=NTP_PORT):
+		self.pool = pool
+		self.servers = servers
+		self.samples = samples
+		self.timeout = timeout
+		self.port = port
+		self._packet = bytearray(PACKET_SIZE)
+		self._cookie = bytearray(8)
+		self.errors = []
+
+	def _request(self):
+		"""Fill the packet with a request"""
+		packet = self._packet
+		for index in range(PACKET_SIZE):
+			packet[index] = 0
+		packet[0] = CLIENT_HEADER
+		# the transmit timestamp is copied in the originate field of the reply,
+		# it doesn't need to be the time, only to be unique
+		struct.pack_into("!Q", packet, 40, time.monotonic_ns() & 0xFFFFFFFFFFFFFFFF)
+		self._cookie[:] = packet[40:48]
+
+	def _is_reply(self, size):
+		"""If the packet received is the reply to our request"""
+		return size >= PACKET_SIZE and self._packet[24:32] == self._cookie
+
+	def _sample(self, server, sent, received):
+		"""The NTPSample of the reply in the packet"""
+		packet = self._packet
+		leap = packet[0] >> 6
+		mode = packet[0] & 0b111
+		stratum = packet[1]
+		if leap == LEAP_UNSYNCHRONIZED or mode != MODE_SERVER or stratum == 0:
+			# stratum 0 is a "kiss of death", the server asks us to go away
+			raise OSError(f"{server} is not synchronized")
+		server_received = to_ns(*struct.unpack_from("!II", packet, 32))
+		server_sent = to_ns(*struct.unpack_from("!II", packet, 40))
+		offset = ((server_received - sent) + (server_sent - received)) // 2
+		delay = (received - sent) - (server_sent - server_received)
+		return NTPSample(server, offset, delay, stratum)
+
+	async def query_async(self, server):
+		"""
+		One request to the server, returns a NTPSample, raises OSError.
+		The other tasks run until the reply arrives.
+		"""
+		pool = self.pool
+		# sendto() would resolve the name after the send time is taken
+		address = pool.getaddrinfo(server, self.port)[0][-1]
+		self._request()
+		with pool.socket(pool.AF_INET, pool.SOCK_DGRAM) as sock:
+			sock.setblocking(False)
+			sent = time.monotonic_ns()
+			sock.sendto(self._packet, address)
+			deadline = sent + int(self.timeout * 1_000_000_000)
+			while True:
+				try:
+					size = sock.recv_into(self._packet)
+				except OSError as error:
+					if error.errno != errno.EAGAIN:
+						raise
+					# nothing received yet
+					size = 0
+				received = time.monotonic_ns()
+				if self._is_reply(size):
+					break
+				# no reply, or a late reply to an earlier request
+				if received >= deadline:
+					raise OSError("no valid reply from " + server)
+				await asyncio.sleep(POLL_DELAY)
+		return self._sample(server, sent, received)
+
+	async def sync_async(self):
+		"""
+		Query the servers, return the best NTPSample, raise OSError if none.
+		The other tasks run while waiting for the replies.
+		"""
+		best = None
+		self.errors = []
+		for server in self.servers:
+			for _ in range(self.samples):
+				try:
+					sample = await self.query_async(server)
+				except OSError as error:
+					self.errors.append((server, error))
+					break
+				if best is None or sample.delay < best.delay:
+					best = sample
+		if best is None:
+			raise OSError("no NTP server answered")
+		return best
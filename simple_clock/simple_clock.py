@@ -1,36 +1,49 @@
+import asyncio
 import board
 import busio
-from digitalio import DigitalInOut, Pull
+import microcontroller
 import os
 import random
 import rtc
-import struct
 import sys
 import time
-import wifi
 import usb_cdc
 import traceback
-import ssl
 import supervisor
 
-import adafruit_ht16k33.segments
-import adafruit_requests
 import neopixel
 
 import home_checkers
+from button_events import ButtonEvents, PRESS, LONG_PRESS
+from clock_drift import ClockDrift
+from clock_renderer import ClockRenderer
+from frame_scheduler import FrameScheduler
+from http_cache import HTTPCache
+from message_scroller import MessageScroller
+from net_session import NetworkSession
+from ntp_client import NTPClient
+from pixel_manager import PixelManager
+from segment_display import SegmentDisplay
 
 SPEED_DELAY = 0.1
-SYNC_DELAY = 2 * 60 * 60 # 2h
-HOME_CHECK_DELAY = 2 * 60 * 60 # 2h
-HOME_CHECK_START_DELAY = 1 * 60 # wait 1 minutes before doing checks
+SCROLL_DELAY = SPEED_DELAY # one character per frame
+SYNC_DELAY = 2 * 60 * 60 # 2h, at boot with the RTC set or after a failure, else the drift decides
+SYNC_DELAY_MIN = 30 * 60 # 30 min
+SYNC_DELAY_MAX = 24 * 60 * 60 # 24h
+TIME_ERROR_BUDGET = 0.5 # error of the time allowed between syncs, in seconds
 HOME_CHECK_PRINT_DELAY = 30
+NETWORK_ALIGN = 0.5 # do a network task early if that part of its delay is over
+INPUT_DELAY = 0.1 # read the buttons, keypad keeps the events in between
+NETWORK_DELAY = 1 # see if the sync or the checks are due
+BRIGHTNESS_DELAY = 10 # see if the 10 minutes of the brightness are over
 
 SEASONS = { "WINTER": 0, "SUMMER": 1 }
 SEASON = 0
 
 TZ_OFFSET = 0
-NTP_SERVER = "pool.ntp.org"
-NTP_PORT = 123
+NTP_SERVERS = ("0.pool.ntp.org", "1.pool.ntp.org", "2.pool.ntp.org")
+NTP_SAMPLES = 2
+NTP_TIMEOUT = 1
 
 ####################################################################
 # import secrets and config from secrets
@@ -49,6 +62,9 @@ if "SEASON" in secrets:
 
 TZ_OFFSET += SEASON
 
+if "NTP_SERVERS" in secrets:
+	NTP_SERVERS = secrets["NTP_SERVERS"]
+
 ####################################################################
 # setup prints
 ####################################################################
@@ -65,27 +81,14 @@ def log_info(*args):
 # setup buttons
 ####################################################################
 
-butA = DigitalInOut(board.IO38)
-butA.switch_to_input(Pull.DOWN)
-butB = DigitalInOut(board.IO33)
-butB.switch_to_input(Pull.DOWN)
-but1 = DigitalInOut(board.IO6)
-but1.switch_to_input(Pull.DOWN)
-but2 = DigitalInOut(board.IO5)
-but2.switch_to_input(Pull.DOWN)
-
-buttons = [
-	[butA,"BUTA"],
-	[butB,"BUTB"],
-	[but1,"BUT1"],
-	[but2,"BUT2"],
-]
+buttons = ButtonEvents((board.IO38, board.IO33, board.IO6, board.IO5))
+BUTA, BUTB, BUT1, BUT2 = range(4)
 
 ####################################################################
 # setup displays and blinkies
 ####################################################################
 
-pixels = neopixel.NeoPixel(board.IO7,5,auto_write = False)
+pixels = PixelManager(neopixel.NeoPixel(board.IO7,5,auto_write = False))
 pixels.fill((0,0,0))
 pixels.show()
 
@@ -97,20 +100,13 @@ colors = [
 	(255,0,0),
 ]
 
-status = neopixel.NeoPixel(board.NEOPIXEL,1)
+status = PixelManager(neopixel.NeoPixel(board.NEOPIXEL,1,auto_write = False))
 status.fill((0,0,0))
+status.show()
 
 i2c = busio.I2C(sda=board.SDA, scl=board.SCL, frequency=400_000)
-display = adafruit_ht16k33.segments.Seg14x4(i2c, address=(0x70, 0x72, 0x74), auto_write=False)
-
-# display a cleaner 5 
-CHARS = list(adafruit_ht16k33.segments.CHARS)
-NUMBERS = list(adafruit_ht16k33.segments.NUMBERS)
-CHARS[ord("5") * 2 - 64] = CHARS[ord("S") * 2 - 64]
-CHARS[ord("5") * 2 - 64 + 1] = CHARS[ord("S") * 2 - 64 + 1]
-NUMBERS[5] = 16 * CHARS[ord("S") * 2 - 64] + CHARS[1 + ord("S") * 2 - 64]
-adafruit_ht16k33.segments.CHARS = tuple(CHARS)
-adafruit_ht16k33.segments.NUMBERS = tuple(NUMBERS)
+display = SegmentDisplay(i2c, address=(0x70, 0x72, 0x74), auto_write=False)
+scroller = MessageScroller(display, delay=SCROLL_DELAY)
 
 def seg_brightness(val):
 	display.brightness = val
@@ -118,17 +114,13 @@ def seg_brightness(val):
 def seg_show():
 	display.show()
 
-def seg_print(label):
-	display.print(label)
-	seg_show()
-
 def seg_scroll(message):
-	display.marquee(message, delay=0.15, loop=False)
-	time.sleep(1)
+	"""Queue a message, it's scrolled by the clock task"""
+	scroller.add(message)
 
 be_bright = False
-def update_brightness(now):
-	if now.tm_hour < 8 and not be_bright:
+def update_brightness(hour):
+	if hour < 8 and not be_bright:
 		seg_brightness(0.01)
 		pixels.brightness = 0.01
 		status.brightness = 0.01
@@ -143,62 +135,55 @@ def update_brightness(now):
 # setup wifi
 ####################################################################
 
-socket_pool = None
-requests = None
-
-def connect_wifi(verbose=False):
-	"""Re-establish the wifi connection"""
-	global socket_pool, requests
-	import wifi
-	import socketpool
-	if verbose:
-		log_info("Connecting to wifi")
-	wifi.radio.connect(ssid=secrets["ssid"], password=secrets["password"])
-	socket_pool = socketpool.SocketPool(wifi.radio)
-	requests = adafruit_requests.Session(socket_pool, ssl.create_default_context())
-	if verbose:
-		log_info("Connected with IP ", wifi.radio.ipv4_address)
-
-def get_ntp_time(pool):
-	"""Get time from NTP server the low level way"""
-	packet = bytearray(48)
-	packet[0] = 0b00100011
-
-	for i in range(1, len(packet)):
-		packet[i] = 0
-
-	with pool.socket(pool.AF_INET, pool.SOCK_DGRAM) as sock:
-		# have a timeout, or it might hang
-		sock.settimeout(2)
-		sock.sendto(packet, (NTP_SERVER, NTP_PORT))
-		sock.recv_into(packet)
-		destination = time.monotonic_ns()
-
-	seconds = struct.unpack_from("!I", packet, offset=len(packet) - 8)[0]
-	monotonic_start = seconds - 2_208_988_800 - (destination // 1_000_000_000)
-	return time.localtime(time.monotonic_ns() // 1_000_000_000 + monotonic_start + TZ_OFFSET)
-
-def update_NTP():
-	"""The NTP update procedure, with screen indications and such"""
-	pixels.fill((0,128,255))
-	pixels.show()
-	seg_print(" UPDATE NTP ")
+network = NetworkSession(secrets["ssid"], secrets["password"], log=log_info)
+clock_drift = ClockDrift(microcontroller.nvm, TIME_ERROR_BUDGET, SYNC_DELAY_MIN, SYNC_DELAY_MAX)
+home_checkers.cache = HTTPCache(microcontroller.nvm)
+
+async def get_ntp_time(pool):
+	"""The best NTP sample of the servers"""
+	client = NTPClient(pool, NTP_SERVERS, samples=NTP_SAMPLES, timeout=NTP_TIMEOUT)
+	sample = await client.sync_async()
+	for server, error in client.errors:
+		log_info("NTP error", server, error)
+	log_info("NTP from", sample)
+	return sample
+
+async def set_rtc(source):
+	"""
+	Set the RTC at the start of a second, it only keeps whole seconds.
+	The source is a NTP sample or the clock drift model.
+	"""
+	now = source.time_ns() + TZ_OFFSET * 1_000_000_000
+	await asyncio.sleep((1_000_000_000 - now % 1_000_000_000) / 1_000_000_000)
+	now = source.time_ns() + TZ_OFFSET * 1_000_000_000
+	rtc.RTC().datetime = time.localtime(now // 1_000_000_000)
+	clock_drift.rtc_was_set()
+
+async def update_NTP():
+	"""
+	The NTP update procedure, the status pixel is blue while it runs.
+	Returns the delay until the next update.
+	Call it in a network window: with network: await update_NTP()
+	"""
+	status.fill((0,128,255))
+	status.show()
 	log_info("Update from NTP")
 	try:
-		wifi.radio.enabled = True
-		log_info("Connect Wifi")
-		connect_wifi(verbose=True)
-		rtc.RTC().datetime = get_ntp_time(socket_pool)
-		time.sleep(0.1)
+		sample = await get_ntp_time(network.pool)
+		error = clock_drift.sync(sample)
+		await set_rtc(clock_drift)
+		if error is not None:
+			log_info(f"Clock error: {error:+.3f} s")
+		log_info(clock_drift.report())
+		return clock_drift.sync_delay()
 	except Exception as ex:
 		print("Exception")
 		print(ex)
-		seg_print(" NTP FAILED ")
-		time.sleep(2)
+		seg_scroll("NTP FAILED")
 	finally:
-		log_info("Turn off Wifi")
-		wifi.radio.enabled = False
-		requests = None
+		status.fill(0)
+		status.show()
+	return SYNC_DELAY
 
 ####################################################################
 # time functions
@@ -206,29 +191,7 @@ def update_NTP():
 
 week_days = ["Lun","Mar","Mer","Jeu","Ven","Sam","Dim"]
 
-def get_time_string(now, show_separator = True):
-	"""Format the time string with optional separator"""
-	if show_separator:
-		sep = "."
-	else:
-		sep = ""
-
-	day = week_days[now.tm_wday].upper()
-	daynum = f"{now.tm_mday:2d}"
-
-	return (
-		f"{day}{daynum[0]}"
-		+f"{daynum[1]} {now.tm_hour:02d}{sep}"
-		+f"{now.tm_min:02d}{sep}{now.tm_sec:02d}"
-	)
-
-def update_time(show_separator = True):
-	"""Update the time on the screen"""
-	now = time.localtime()
-	time_string = get_time_string(now, show_separator)
-	display.print(time_string)
-	seg_show()
-	return now
+clock = ClockRenderer(display, week_days)
 
 ####################################################################
 # checks
@@ -237,26 +200,26 @@ def update_time(show_separator = True):
 check_messages = {}
 
 def display_check_messages():
-	"""Display the check messages"""
+	"""Display the check messages, unless they are still scrolling"""
+	if scroller.active:
+		return
 	for (ok, check_id, message) in check_messages.values():
 		if not ok:
 			seg_scroll(message)
 
-def do_home_checks():
-	"""Call the home checkers functions that do... whatever they do"""
-	global requests
-	pixels.fill((128,0,255))
-	pixels.show()
+async def do_home_checks(early=0):
+	"""
+	Call the home checkers functions that do... whatever they do.
+	Those that are due, or which early part of the interval is over.
+	The status pixel is purple while they run. Their requests block, the
+	clock is not updated until each one answers or times out.
+	Call it in a network window: with network: await do_home_checks()
+	"""
+	status.fill((128,0,255))
+	status.show()
 	try:
-		now = time.localtime()
-		time_string = get_time_string(now)
-		seg_print("CHECK" + time_string[5:])
-		wifi.radio.enabled = True
-		connect_wifi(verbose=True)
-		time.sleep(0.1)
-		# do the checks
 		log_info("Perform home checks")
-		res = home_checkers.do_checks(requests)
+		res = await home_checkers.do_checks_async(network.requests, early)
 		for (ok, check_id, message) in res:
 			if not ok:
 				print(message)
@@ -267,12 +230,12 @@ def do_home_checks():
 		print("Exception")
 		print(ex)
 		traceback.print_exception(ex, ex, ex.__traceback__)
-		seg_print("CHECK FAILED")
-		time.sleep(2)
+		seg_scroll("CHECK FAILED")
+		# no result: don't try again at every window
+		home_checkers.retry_later(early)
 	finally:
-		log_info("Turn off Wifi")
-		wifi.radio.enabled = False
-		requests = None
+		status.fill(0)
+		status.show()
 
 
 ####################################################################
@@ -284,12 +247,14 @@ pixels.show()
 seg_brightness(1)
 seg_show()
 
+sync_delay = SYNC_DELAY
 now = time.localtime()
 if now.tm_year < 2021:
-	update_NTP()
+	with network:
+		sync_delay = asyncio.run(update_NTP())
 	now = time.localtime()
 
-update_brightness(now)
+update_brightness(now.tm_hour)
 
 log_info("Now is:",now)
 
@@ -315,69 +280,121 @@ for x in range(2):
 	pixcol()
 
 ####################################################################
-# setup loop variables and parameters
+# tasks
 ####################################################################
 
-defcon = 0
-next_sync = time.monotonic() + SYNC_DELAY
-next_home_check = time.monotonic() + HOME_CHECK_START_DELAY
-next_home_print = time.monotonic() + HOME_CHECK_PRINT_DELAY
-last_b_update = 0
+frames = FrameScheduler(SPEED_DELAY)
+# set by the buttons
+sync_now = asyncio.Event()
+check_now = asyncio.Event()
+
+async def clock_task():
+	"""Draw the time, the messages and the defcon every frame"""
+	while True:
+		now_ns = await frames.tick()
+		if scroller.update(now_ns):
+			# draw the time again after the messages
+			clock.invalidate()
+		# redraw when the time or the separators change
+		if clock.update(now_ns, draw=not scroller.active):
+			defcon = clock.second // 10
+
+# 			if clock.second % 2 == 0:
+# 				status.fill(colors[clock.second % 5])
+# 			else:
+# 				status.fill(0)
+
+			for x in range(5):
+				if x < defcon:
+					pixels[4 - x] = colors[x]
+				else:
+					pixels[4 - x] = 0
+			pixels.show()
+
+async def input_task():
+	"""
+	The buttons: 1 brightness, 2 sync the time,
+	A reset the messages, hold A to run the checks again.
+	"""
+	global be_bright, check_messages
+	while True:
+		for key, kind in buttons.update(time.monotonic_ns()):
+			if kind == PRESS and key == BUT1:
+				be_bright = not be_bright
+				update_brightness(clock.hour)
+			elif kind == PRESS and key == BUT2:
+				sync_now.set()
+			elif kind == PRESS and key == BUTA:
+				check_messages = {}
+				log_info("MESSAGES RESET")
+				scroller.clear()
+				seg_scroll("MESSAGES RESET")
+			elif kind == LONG_PRESS and key == BUTA:
+				log_info("CHECK NOW")
+				check_now.set()
+		await asyncio.sleep(INPUT_DELAY)
+
+async def brightness_task():
+	"""Brightness, reports and drift correction every 10 minutes"""
+	last_b_update = 0
+	while True:
+		if clock.minute // 10 != last_b_update:
+			last_b_update = clock.minute // 10
+			update_brightness(clock.hour)
+			log_info(frames.report())
+			log_info(pixels.report())
+			if clock_drift.correction_due():
+				log_info("Correct the drift of the RTC")
+				await set_rtc(clock_drift)
+		await asyncio.sleep(BRIGHTNESS_DELAY)
+
+async def network_task():
+	"""The NTP sync and the home checks, in the same window when possible"""
+	global sync_delay
+	next_sync = time.monotonic() + sync_delay
+	next_home_check = home_checkers.next_time()
+	while True:
+		if check_now.is_set():
+			# all the checks when asked with the button
+			home_checkers.make_due()
+			next_home_check = home_checkers.next_time()
+		sync_due = sync_now.is_set() or time.monotonic() > next_sync
+		check_due = time.monotonic() >= next_home_check
+		sync_now.clear()
+		check_now.clear()
+		if sync_due or check_due:
+			# do the other task early if it's due soon, with the same connection
+			now = time.monotonic()
+			with network:
+				if sync_due or now > next_sync - sync_delay * NETWORK_ALIGN:
+					sync_delay = await update_NTP()
+					next_sync = time.monotonic() + sync_delay
+				if check_due or home_checkers.due_checks(NETWORK_ALIGN):
+					await do_home_checks(NETWORK_ALIGN)
+					next_home_check = home_checkers.next_time()
+		await asyncio.sleep(NETWORK_DELAY)
+
+async def messages_task():
+	"""Scroll the failed checks again from time to time"""
+	while True:
+		await asyncio.sleep(HOME_CHECK_PRINT_DELAY)
+		display_check_messages()
+
+async def main():
+	await asyncio.gather(
+		clock_task(),
+		input_task(),
+		brightness_task(),
+		network_task(),
+		messages_task(),
+	)
 
 ####################################################################
 # loop-dee-loop
 ####################################################################
 
-index = 0
 try:
-	while True:
-		# scroll
-		now = update_time(index // 4 % 2 == 0)
-		defcon = now.tm_sec // 10
-
-# 		if now.tm_sec % 2 == 0:
-# 			status.fill(colors[now.tm_sec % 5])
-# 		else:
-# 			status.fill(0)
-
-		pixels.fill(0)
-		for x in range(5):
-			if x < defcon:
-				pixels[4 - x] = colors[x]
-			else:
-				pixels[4 - x] = 0
-		pixels.show()
-
-		index += 1
-		time.sleep(SPEED_DELAY)
-
-		if now.tm_min // 10 != last_b_update:
-			last_b_update = now.tm_min // 10
-			update_brightness(now)
-
-		if but1.value:
-			be_bright = not be_bright
-			update_brightness(now)
-			while but1.value:
-				time.sleep(0.1)
-
-		if but2.value or time.monotonic() > next_sync:
-			update_NTP()
-			next_sync = time.monotonic() + SYNC_DELAY
-
-		if butA.value:
-			check_messages = {}
-			log_info("MESSAGES RESET")
-			seg_scroll("MESSAGES RESET")
-
-		if time.monotonic() > next_home_check:
-			do_home_checks()
-			next_home_check = time.monotonic() + HOME_CHECK_DELAY
-
-		if time.monotonic() > next_home_print:
-			display_check_messages()
-			next_home_print = time.monotonic() + HOME_CHECK_PRINT_DELAY
-
+	asyncio.run(main())
 
 except Exception as ex:
 	pixels.fill((255,0,0))
@@ -385,10 +402,17 @@ except Exception as ex:
 	pixels.show()
 	display.fill(1)
 
-	while not but1.value and not but2.value:
-		print("-"*70)
-		traceback.print_exception(ex, ex, ex.__traceback__)
-		print("----- Hold button to quit -----")
-		time.sleep(5)
+	buttons.clear()
+	next_print = 0
+	while True:
+		if time.monotonic() > next_print:
+			print("-"*70)
+			traceback.print_exception(ex, ex, ex.__traceback__)
+			print("----- Hold button to quit -----")
+			next_print = time.monotonic() + 5
+		events = buttons.update(time.monotonic_ns())
+		if any(kind == LONG_PRESS and key in (BUT1, BUT2) for key, kind in events):
+			break
+		time.sleep(0.1)
 
 	supervisor.reload()
@@ -0,0 +1,36 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+The \\u escapes of the strings read by json_stream.
+"""
+import json
+import os
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO, "simple_clock"))
+
+from json_stream import find_path
+
+
+def chunks(text, size=1):
+	"""The document in chunks of bytes, the escapes are split too"""
+	data = text.encode()
+	return [data[index:index + size] for index in range(0, len(data), size)]
+
+
+def test_surrogate_pair():
+	document = '[{"name": "smile \\ud83d\\ude00 \\u00e9", "next": 1}]'
+	expected = json.loads(document)[0]["name"]
+	assert expected == "smile \U0001f600 é"
+	assert find_path(chunks(document), "[0].name") == expected
+	assert find_path(chunks(document, 64), "[0].name") == expected
+
+
+def test_lone_surrogates():
+	document = '{"high": "a\\ud83db", "low": "a\\ude00b", "escape": "\\ud83d\\n",'
+	document += ' "twice": "\\ud83d\\ud83d\\ude00"}'
+	assert find_path(chunks(document), "high") == "a\ufffdb"
+	assert find_path(chunks(document), "low") == "a\ufffdb"
+	assert find_path(chunks(document), "escape") == "\ufffd\n"
+	assert find_path(chunks(document), "twice") == "\ufffd\U0001f600"
@@ -0,0 +1,64 @@
+# SPDX-FileCopyrightText: Copyright 2023 Neradoc, https://neradoc.me
+# SPDX-License-Identifier: MIT
+"""
+The pack build of make_dicts.py with bad frequencies in the dictionary.
+"""
+import os
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO, "password_cracking_animation"))
+
+import make_dicts
+import word_store
+
+
+def build_pack(tmp_path, monkeypatch, lines):
+	"""Make a pack from word and frequency lines, return it open"""
+	dictionary = tmp_path / "words.tsv"
+	dictionary.write_text("".join(line + "\n" for line in lines))
+	output = tmp_path / "words"
+	monkeypatch.setattr(sys, "argv", [
+		"make_dicts.py", str(dictionary), "--output", str(output),
+		"--format", "pack", "--freq-column", "2", "--jobs", "1",
+	])
+	make_dicts.main()
+	return word_store.WordPack(f"{output}.bin")
+
+
+def test_zero_frequencies(tmp_path, monkeypatch):
+	pack = build_pack(tmp_path, monkeypatch, [
+		"cat\t0", "dog\t0", "house\t3", "mouse\t1",
+	])
+	try:
+		# the words of the size are packed, but the size is never picked
+		assert pack.count(3) == 2
+		assert pack.sizes == [5]
+		assert pack.random_word(5) in ("house", "mouse")
+	finally:
+		pack.close()
+
+
+def test_negative_frequency(tmp_path, monkeypatch):
+	assert make_dicts.normalize("cat\t-2", ("\t", 0, 1)) is None
+	pack = build_pack(tmp_path, monkeypatch, [
+		"cat\t-2", "dog\t1", "cow\t3",
+	])
+	try:
+		assert pack.count(3) == 2
+		assert pack.random_word(3) in ("dog", "cow")
+	finally:
+		pack.close()
+
+
+def test_nan_frequency(tmp_path, monkeypatch):
+	assert make_dicts.normalize("cat\tnan", ("\t", 0, 1)) is None
+	assert make_dicts.normalize("cat\tinf", ("\t", 0, 1)) is None
+	pack = build_pack(tmp_path, monkeypatch, [
+		"cat\tnan", "pig\tinf", "dog\t1", "cow\t2",
+	])
+	try:
+		assert pack.count(3) == 2
+		assert pack.random_word(3) in ("dog", "cow")
+	finally:
+		pack.close()